@@ -15,10 +15,25 @@ top-level functions to this file.p-
 """
 from __future__ import annotations
 import csv
-from typing import Any, Dict, List, Optional, Tuple
-
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, \
+    Optional, Tuple
+
+from chunked_reader import CHUNK_SIZE, is_compressed, iter_blocks, \
+    iter_lines
 from melody import Melody
-from new_prefix import SimplePrefixTree, CompressedPrefixTree
+from prefix_tree import SimplePrefixTree, CompressedPrefixTree, PageCursor
+from frozen_prefix_tree import FrozenPrefixTree
+from result_cache import ResultCache
+from sanitize import sanitize, words
+
+# The number of line ranges given to each worker process, so that the
+# processes finish at about the same time even if some ranges are slower.
+_RANGES_PER_WORKER = 4
 
 
 ################################################################################
@@ -36,18 +51,35 @@ class LetterAutocompleteEngine:
 
     === Attributes ===
     autocompleter: An Autocompleter used by this engine.
+
+    === Private Attributes ===
+    _cache: The cache of results returned by autocomplete.
     """
     autocompleter: Autocompleter
+    _cache: ResultCache
 
     def __init__(self, config: Dict[str, Any]) -> None:
         """Initialize this engine with the given configuration.
 
         <config> is a dictionary consisting of the following keys:
-            - 'file': the path to a text file
+            - 'file': the path to a text file, which may be compressed
+              with gzip or zstd (zstd needs the zstandard package)
             - 'autocompleter': either the string 'simple' or 'compressed',
               specifying which subclass of Autocompleter to use.
             - 'weight_type': either 'sum' or 'average', which specifies the
               weight type for the prefix tree.
+            - 'top_k' (optional): if given and > 0, every non-leaf tree
+              caches its 'top_k' heaviest values, which makes autocomplete
+              with a limit of at most 'top_k' a single descent.
+            - 'cache_size' (optional): if given and > 0, up to 'cache_size'
+              autocomplete results are cached, least recently used first out.
+            - 'cache_ttl' (optional): the number of seconds a cached result
+              is kept for; by default results do not expire.
+            - 'workers' (optional): if given and > 1, the file is split into
+              ranges of whole lines that this many processes read and
+              sanitize in parallel. A compressed file is read by one
+              process. Only reading is parallel: the prefix tree is still
+              built by this process, and that usually takes far longer.
 
         Each line of the specified file counts as one input string.
         Note that the line may or may not contain spaces.
@@ -65,27 +97,13 @@ class LetterAutocompleteEngine:
         # We've opened the file for you here. You should iterate over the
         # lines of the file and process them according to the description in
         # this method's docstring.
-        if config['autocompleter'] == 'simple':
-            self.autocompleter = SimplePrefixTree(config['weight_type'])
-        else:
-            self.autocompleter = CompressedPrefixTree(config['weight_type'])
-        with open(config['file'], encoding='utf8') as f:
-            for line in f:
-                copy = line.strip('\n')
-                lst = []
-                insert = ''
-                for item in copy:
-                    if item.isalnum() or item.isspace():
-                        if item.isalpha():
-                            lst.append(item.lower())
-                        else:
-                            lst.append(item)
-                        check = list(item)
-                        for let in check:
-                            insert += let.lower()
-                print(insert)
-                if len(lst) != 0:
-                    self.autocompleter.insert(insert, 1, lst)
+        counts = _read_counts(_read_letters, config['file'],
+                              config.get('workers', 1))
+        items = [(line, count, list(line)) for line, count in counts.items()]
+        self.autocompleter = _tree_class(config).from_items(
+            config['weight_type'], items, config.get('top_k', 0))
+        self._cache = ResultCache(config.get('cache_size', 0),
+                                  config.get('cache_ttl'))
 
     def autocomplete(self, prefix: str,
                      limit: Optional[int] = None) -> List[Tuple[str, float]]:
@@ -104,7 +122,48 @@ class LetterAutocompleteEngine:
             <prefix> contains only lowercase alphanumeric characters and spaces
         """
         new_prefix = list(prefix)
-        return self.autocompleter.autocomplete(new_prefix, limit)
+        return self._cache.lookup(new_prefix, limit,
+                                  self.autocompleter.autocomplete)
+
+    def autocomplete_many(self, queries: Iterable[Tuple[str, Optional[int]]]
+                          ) -> List[List[Tuple[str, float]]]:
+        """Return the result of autocomplete(prefix, limit) for each
+        (prefix, limit) pair in <queries>, in the same order.
+
+        Preconditions:
+            each limit is None or limit > 0
+            each prefix contains only lowercase alphanumeric characters and
+            spaces
+        """
+        return self.autocompleter.autocomplete_many(
+            [(list(prefix), limit) for prefix, limit in queries])
+
+    def iter_autocomplete(self, prefix: str) -> Iterator[Tuple[str, float]]:
+        """Yield the matches for the given prefix string as tuples
+        (string, weight), in non-increasing weight order.
+
+        Precondition: <prefix> contains only lowercase alphanumeric characters
+                      and spaces.
+        """
+        return self.autocompleter.iter_autocomplete(list(prefix))
+
+    def autocomplete_page(self, prefix: str, page_size: int,
+                          cursor: Optional[PageCursor] = None
+                          ) -> Tuple[List[Tuple[str, float]],
+                                     Optional[PageCursor]]:
+        """Return the next <page_size> matches for the given prefix string, and
+        a cursor for the page after them, or None if there are no more matches.
+
+        Pass None as <cursor> for the first page, and the returned cursor to
+        get each page after it. Raise ValueError if this engine's
+        Autocompleter has changed since <cursor> was returned.
+
+        Preconditions:
+            page_size > 0
+            <prefix> contains only lowercase alphanumeric characters and spaces
+        """
+        return self.autocompleter.autocomplete_page(list(prefix), page_size,
+                                                    cursor)
 
     def remove(self, prefix: str) -> None:
         """Remove all strings that match the given prefix string.
@@ -117,6 +176,40 @@ class LetterAutocompleteEngine:
         """
         new_prefix = list(prefix)
         self.autocompleter.remove(new_prefix)
+        self._cache.removed([new_prefix])
+
+    def remove_many(self, prefixes: Iterable[str]) -> None:
+        """Remove all strings that match any of the given prefix strings.
+
+        Precondition: each prefix contains only lowercase alphanumeric
+                      characters and spaces.
+        """
+        new_prefixes = [list(prefix) for prefix in prefixes]
+        self.autocompleter.remove_many(new_prefixes)
+        self._cache.removed(new_prefixes)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Return the hit, miss and eviction counts of this engine's result
+        cache, and the number of results it currently holds.
+        """
+        return self._cache.stats()
+
+    def save(self, path: str) -> None:
+        """Save the strings in this engine to the file at <path>, from which
+        load can start a new engine without reading the original input file.
+        """
+        _save(self, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> LetterAutocompleteEngine:
+        """Return an engine answering queries from the file at <path>, which
+        was written by save.
+
+        If <mmap> is True, the file is memory-mapped and queries are answered
+        directly from the map. The new engine's Autocompleter is read-only, and
+        it does not cache results.
+        """
+        return _load(cls, path, mmap)
 
 
 class SentenceAutocompleteEngine:
@@ -132,18 +225,43 @@ class SentenceAutocompleteEngine:
 
     === Attributes ===
     autocompleter: An Autocompleter used by this engine.
+
+    === Private Attributes ===
+    _cache: The cache of results returned by autocomplete.
+    _lock:
+        Held while the Autocompleter or the cache is used, so that the
+        thread started by follow changes them only between queries.
+    _follower: The thread started by follow, or None if there is none.
+    _stop: The event that tells _follower to stop, or None.
     """
     autocompleter: Autocompleter
+    _cache: ResultCache
+    _lock: threading.Lock
+    _follower: Optional[threading.Thread]
+    _stop: Optional[threading.Event]
 
     def __init__(self, config: Dict[str, Any]) -> None:
         """Initialize this engine with the given configuration.
 
         <config> is a dictionary consisting of the following keys:
-            - 'file': the path to a CSV file
+            - 'file': the path to a CSV file, which may be compressed
+              with gzip or zstd (zstd needs the zstandard package)
             - 'autocompleter': either the string 'simple' or 'compressed',
               specifying which subclass of Autocompleter to use.
             - 'weight_type': either 'sum' or 'average', which specifies the
               weight type for the prefix tree.
+            - 'top_k' (optional): if given and > 0, every non-leaf tree
+              caches its 'top_k' heaviest values, which makes autocomplete
+              with a limit of at most 'top_k' a single descent.
+            - 'cache_size' (optional): if given and > 0, up to 'cache_size'
+              autocomplete results are cached, least recently used first out.
+            - 'cache_ttl' (optional): the number of seconds a cached result
+              is kept for; by default results do not expire.
+            - 'workers' (optional): if given and > 1, the file is split into
+              ranges of whole lines that this many processes read and
+              sanitize in parallel. A compressed file is read by one
+              process. Only reading is parallel: the prefix tree is still
+              built by this process, and that usually takes far longer.
 
         Precondition:
         The given file is a *CSV file* where each line has two entries:
@@ -165,34 +283,17 @@ class SentenceAutocompleteEngine:
         """
         # We haven't given you any starter code here! You should review how
         # you processed CSV files on Assignment 1.
-        if config['autocompleter'] == 'simple':
-            self.autocompleter = SimplePrefixTree(config['weight_type'])
-        else:
-            self.autocompleter = CompressedPrefixTree(config['weight_type'])
-        with open(config['file']) as csv_file:
-            reader = csv.reader(csv_file, delimiter=',')
-            for line in reader:
-                check = list(line[0])
-                weight = float(line[1])
-                prefix = ''
-                inserting = ''
-                lst = []
-                for item in check:
-                    if item.isalnum():
-                        if item.isalpha():
-                            prefix += item.lower()
-                            inserting += item.lower()
-                        else:
-                            prefix += item
-                            inserting += item.lower()
-                    elif item.isspace() and prefix != '':
-                        lst.append(prefix)
-                        prefix = ''
-                        inserting += ' '
-                lst.append(prefix)
-                if len(inserting) > 0:
-                    self.autocompleter.insert(inserting, weight, lst)
-        csv_file.close()
+        weights = _read_counts(_read_sentences, config['file'],
+                               config.get('workers', 1))
+        items = [(sentence, weight, sentence.split())
+                 for sentence, weight in weights.items()]
+        self.autocompleter = _tree_class(config).from_items(
+            config['weight_type'], items, config.get('top_k', 0))
+        self._cache = ResultCache(config.get('cache_size', 0),
+                                  config.get('cache_ttl'))
+        self._lock = threading.Lock()
+        self._follower = None
+        self._stop = None
 
     def autocomplete(self, prefix: str,
                      limit: Optional[int] = None) -> List[Tuple[str, float]]:
@@ -210,22 +311,67 @@ class SentenceAutocompleteEngine:
             limit is None or limit > 0
             <prefix> contains only lowercase alphanumeric characters and spaces
         """
-        check = list(prefix)
-        new = ''
-        lst = []
-        for item in check:
-            if item.isalnum():
-                if item.isalpha():
-                    new += item.lower()
-                else:
-                    new += item
-            elif item.isspace() and new != '':
-                lst.append(new)
-                new = ''
-        lst.append(new)
+        with self._lock:
+            return self._cache.lookup(words(prefix), limit,
+                                      self.autocompleter.autocomplete)
 
-        result = self.autocompleter.autocomplete(lst, limit)
-        return result
+    def autocomplete_many(self, queries: Iterable[Tuple[str, Optional[int]]]
+                          ) -> List[List[Tuple[str, float]]]:
+        """Return the result of autocomplete(prefix, limit) for each
+        (prefix, limit) pair in <queries>, in the same order.
+
+        Preconditions:
+            each limit is None or limit > 0
+            each prefix contains only lowercase alphanumeric characters and
+            spaces
+        """
+        queries = [(words(prefix), limit) for prefix, limit in queries]
+        with self._lock:
+            return self.autocompleter.autocomplete_many(queries)
+
+    def iter_autocomplete(self, prefix: str) -> Iterator[Tuple[str, float]]:
+        """Yield the matches for the given prefix string as tuples
+        (string, weight), in non-increasing weight order.
+
+        Raise RuntimeError if this engine's Autocompleter changes (for
+        example, through follow) before every match has been yielded.
+
+        Precondition: <prefix> contains only lowercase alphanumeric characters
+                      and spaces.
+        """
+        tree = self.autocompleter
+        matches = tree.iter_autocomplete(words(prefix))
+        version = None
+        while True:
+            with self._lock:
+                if version is None:
+                    version = tree._version
+                elif tree._version != version:
+                    raise RuntimeError('the Autocompleter changed while its '
+                                       'matches were being yielded')
+                match = next(matches, None)
+            if match is None:
+                return
+            yield match
+
+    def autocomplete_page(self, prefix: str, page_size: int,
+                          cursor: Optional[PageCursor] = None
+                          ) -> Tuple[List[Tuple[str, float]],
+                                     Optional[PageCursor]]:
+        """Return the next <page_size> matches for the given prefix string, and
+        a cursor for the page after them, or None if there are no more matches.
+
+        Pass None as <cursor> for the first page, and the returned cursor to
+        get each page after it. Raise ValueError if this engine's
+        Autocompleter has changed since <cursor> was returned.
+
+        Preconditions:
+            page_size > 0
+            <prefix> contains only lowercase alphanumeric characters and spaces
+        """
+        with self._lock:
+            return self.autocompleter.autocomplete_page(words(prefix),
+                                                        page_size, cursor)
 
     def remove(self, prefix: str) -> None:
         """Remove all strings that match the given prefix.
@@ -236,20 +382,167 @@ class SentenceAutocompleteEngine:
         Precondition: <prefix> contains only lowercase alphanumeric characters
                       and spaces.
         """
-        check = list(prefix)
-        new = ''
-        lst = []
-        for item in check:
-            if item.isalnum():
-                if item.isalpha():
-                    new += item.lower()
+        new_prefix = words(prefix)
+        with self._lock:
+            self.autocompleter.remove(new_prefix)
+            self._cache.removed([new_prefix])
+
+    def remove_many(self, prefixes: Iterable[str]) -> None:
+        """Remove all strings that match any of the given prefixes.
+
+        Precondition: each prefix contains only lowercase alphanumeric
+                      characters and spaces.
+        """
+        new_prefixes = [words(prefix) for prefix in prefixes]
+        with self._lock:
+            self.autocompleter.remove_many(new_prefixes)
+            self._cache.removed(new_prefixes)
+
+    def follow(self, path: str, interval: float = 1.0,
+               batch_size: int = 10000, from_start: bool = False) -> None:
+        """Start a thread that tails the CSV log at <path>, in the same format
+        as config['file'], and adds the weight on each new line to its
+        sanitized string, while this engine keeps answering queries.
+
+        The log is read from its end, or from its start if <from_start> is
+        True. New lines are gathered into batches of up to <batch_size>
+        lines, and each batch is built into a prefix tree of its own and
+        merged into this engine's Autocompleter at once. Once the end of the
+        log is reached, the thread checks for new lines every <interval>
+        seconds. Lines that are not valid CSV or whose weight is not a number
+        are skipped, and if the log is truncated it is read again from its
+        start.
+
+        Raise TypeError if this engine's Autocompleter is read-only, and
+        ValueError if this engine is already following a log.
+
+        Preconditions:
+            The log is not compressed.
+            interval > 0 and batch_size > 0
+            Every weight in the log is > 0.
+        """
+        if isinstance(self.autocompleter, FrozenPrefixTree):
+            raise TypeError('a frozen prefix tree cannot be changed')
+        if self._follower is not None and self._follower.is_alive():
+            raise ValueError('this engine is already following a log')
+        log = open(path, 'rb')
+        if not from_start:
+            log.seek(0, os.SEEK_END)
+        self._stop = threading.Event()
+        self._follower = threading.Thread(
+            target=self._follow_log, args=(log, interval, batch_size),
+            daemon=True)
+        self._follower.start()
+
+    def stop_following(self) -> None:
+        """Stop the thread started by follow, once it has merged the batch
+        it is working on. Do nothing if this engine is not following a log.
+        """
+        if self._follower is not None:
+            self._stop.set()
+            self._follower.join()
+            self._follower = None
+            self._stop = None
+
+    def _follow_log(self, log: BinaryIO, interval: float,
+                    batch_size: int) -> None:
+        """Add the weights on the lines read from <log> to this engine's
+        Autocompleter in batches until self._stop is set, as described in
+        follow, and then close <log>.
+        """
+        stop = self._stop
+        # The bytes after the last complete line read so far.
+        pending = b''
+        batch = {}
+        lines = 0
+        with log:
+            while not stop.is_set():
+                data = log.read(CHUNK_SIZE)
+                if not data and os.fstat(log.fileno()).st_size < log.tell():
+                    log.seek(0)
+                    pending = b''
+                    continue
+                cut = data.rfind(b'\n')
+                if cut < 0:
+                    pending += data
                 else:
-                    new += item
-            elif item.isspace() and new != '':
-                lst.append(new)
-                new = ''
-        lst.append(new)
-        self.autocompleter.remove(lst)
+                    text = (pending + data[:cut + 1]).decode('utf8', 'replace')
+                    pending = data[cut + 1:]
+                    lines = self._batch_rows(text, batch, lines, batch_size)
+                if not data:
+                    self._flush_batch(batch)
+                    lines = 0
+                    stop.wait(interval)
+            self._flush_batch(batch)
+
+    def _batch_rows(self, text: str, batch: Dict[str, float], lines: int,
+                    batch_size: int) -> int:
+        """Add the weight on each CSV row in <text> to <batch>, which already
+        holds the weights from <lines> lines, and flush <batch> each time it
+        holds the weights from <batch_size> lines. Return the number of lines
+        whose weights <batch> holds afterwards.
+        """
+        for row in _csv_rows(text):
+            lines += 1
+            try:
+                _add_sentence(batch, row)
+            except ValueError:
+                pass
+            if lines >= batch_size:
+                self._flush_batch(batch)
+                lines = 0
+        return lines
+
+    def _flush_batch(self, batch: Dict[str, float]) -> None:
+        """Merge the weights in <batch>, if there are any, into this engine's
+        Autocompleter, and empty <batch>.
+        """
+        if batch:
+            self._merge_weights(batch)
+            batch.clear()
+
+    def _merge_weights(self, weights: Dict[str, float]) -> None:
+        """Add each weight in <weights> to the sentence it is keyed by.
+
+        The new weights are built into a prefix tree of their own before
+        this engine's lock is taken, so that queries only wait for the merge.
+        """
+        tree = self.autocompleter
+        items = [(sentence, weight, sentence.split())
+                 for sentence, weight in weights.items()]
+        delta = type(tree).from_items(tree.weight_type, items)
+        with self._lock:
+            tree.merge(delta)
+            for _, _, prefix in items:
+                self._cache.inserted(prefix)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Return the hit, miss and eviction counts of this engine's result
+        cache, and the number of results it currently holds.
+        """
+        return self._cache.stats()
+
+    def save(self, path: str) -> None:
+        """Save the strings in this engine to the file at <path>, from which
+        load can start a new engine without reading the original input file.
+        """
+        with self._lock:
+            _save(self, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> SentenceAutocompleteEngine:
+        """Return an engine answering queries from the file at <path>, which
+        was written by save.
+
+        If <mmap> is True, the file is memory-mapped and queries are answered
+        directly from the map. The new engine's Autocompleter is read-only, and
+        it does not cache results.
+        """
+        engine = _load(cls, path, mmap)
+        engine._lock = threading.Lock()
+        engine._follower = None
+        engine._stop = None
+        return engine
 
 
 ################################################################################
@@ -267,18 +560,28 @@ class MelodyAutocompleteEngine:
 
     # === Private Attributes ===
     autocompleter: An Autocompleter used by this engine.
+    _cache: The cache of results returned by autocomplete.
     """
     autocompleter: Autocompleter
+    _cache: ResultCache
 
     def __init__(self, config: Dict[str, Any]) -> None:
         """Initialize this engine with the given configuration.
 
         <config> is a dictionary consisting of the following keys:
-            - 'file': the path to a CSV file
+            - 'file': the path to a CSV file, which may be compressed
+              with gzip or zstd (zstd needs the zstandard package)
             - 'autocompleter': either the string 'simple' or 'compressed',
               specifying which subclass of Autocompleter to use.
             - 'weight_type': either 'sum' or 'average', which specifies the
               weight type for the prefix tree.
+            - 'top_k' (optional): if given and > 0, every non-leaf tree
+              caches its 'top_k' heaviest values, which makes autocomplete
+              with a limit of at most 'top_k' a single descent.
+            - 'cache_size' (optional): if given and > 0, up to 'cache_size'
+              autocomplete results are cached, least recently used first out.
+            - 'cache_ttl' (optional): the number of seconds a cached result
+              is kept for; by default results do not expire.
 
         Precondition:
         The given file is a *CSV file* where each line has the following format:
@@ -295,30 +598,24 @@ class MelodyAutocompleteEngine:
         """
         # We haven't given you any starter code here! You should review how
         # you processed CSV files on Assignment 1.
-        if config['autocompleter'] == 'simple':
-            self.autocompleter = SimplePrefixTree(config['weight_type'])
-        else:
-            self.autocompleter = CompressedPrefixTree(config['weight_type'])
-        with open(config['file']) as csv_file:
-            reader = csv.reader(csv_file, delimiter=',')
-            for line in reader:  # each line
-                name = line[0]  # name for every melody obj in on that line
-                # add values to tuple
-                notes = []  # notes for that line, its prefix
-                check = 0
-                for i in range(1, len(line)):
-                    if line[i] == '':
-                        check = len(line)
-                    elif i % 2 != 0 and check < len(line):
-                        tup = (int(line[i]), int(line[i + 1]))
-                        notes.append(tup)
-                obj = Melody(name, notes)
-                prefix = []
-                count = 1
-                for note in obj.notes[:len(obj.notes) - 1]:
-                    prefix.append((obj.notes[count][0]) - (note[0]))
-                    count += 1
-                self.autocompleter.insert(obj, 1, prefix)
+        items = []
+        reader = csv.reader(iter_lines(config['file']), delimiter=',')
+        for line in reader:
+            if not line:
+                continue
+            notes = []
+            for i in range(1, len(line) - 1, 2):
+                if line[i] == '' or line[i + 1] == '':
+                    break
+                notes.append((int(line[i]), int(line[i + 1])))
+            # The prefix is the list of intervals between consecutive notes.
+            prefix = [second[0] - first[0]
+                      for first, second in zip(notes, notes[1:])]
+            items.append((Melody(line[0], notes), 1, prefix))
+        self.autocompleter = _tree_class(config).from_items(
+            config['weight_type'], items, config.get('top_k', 0))
+        self._cache = ResultCache(config.get('cache_size', 0),
+                                  config.get('cache_ttl'))
 
     def autocomplete(self, prefix: List[int],
                      limit: Optional[int] = None) -> List[Tuple[Melody, float]]:
@@ -332,12 +629,209 @@ class MelodyAutocompleteEngine:
         Precondition:
             limit is None or limit > 0
         """
-        return self.autocompleter.autocomplete(prefix, limit)
+        return self._cache.lookup(prefix, limit,
+                                  self.autocompleter.autocomplete)
+
+    def autocomplete_many(self, queries: Iterable[Tuple[List[int],
+                                                        Optional[int]]]
+                          ) -> List[List[Tuple[Melody, float]]]:
+        """Return the result of autocomplete(prefix, limit) for each
+        (prefix, limit) pair in <queries>, in the same order.
+
+        Precondition: each limit is None or limit > 0.
+        """
+        return self.autocompleter.autocomplete_many(queries)
+
+    def iter_autocomplete(self, prefix: List[int]
+                          ) -> Iterator[Tuple[Melody, float]]:
+        """Yield the matches for the given interval sequence as tuples
+        (melody, weight), in non-increasing weight order.
+        """
+        return self.autocompleter.iter_autocomplete(prefix)
+
+    def autocomplete_page(self, prefix: List[int], page_size: int,
+                          cursor: Optional[PageCursor] = None
+                          ) -> Tuple[List[Tuple[Melody, float]],
+                                     Optional[PageCursor]]:
+        """Return the next <page_size> matches for the given interval
+        sequence, and a cursor for the page after them, or None if there are
+        no more matches.
+
+        Pass None as <cursor> for the first page, and the returned cursor to
+        get each page after it. Raise ValueError if this engine's
+        Autocompleter has changed since <cursor> was returned.
+
+        Precondition: page_size > 0.
+        """
+        return self.autocompleter.autocomplete_page(prefix, page_size,
+                                                    cursor)
 
     def remove(self, prefix: List[int]) -> None:
         """Remove all melodies that match the given interval sequence.
         """
         self.autocompleter.remove(prefix)
+        self._cache.removed([prefix])
+
+    def remove_many(self, prefixes: Iterable[List[int]]) -> None:
+        """Remove all melodies that match any of the given interval sequences.
+        """
+        prefixes = list(prefixes)
+        self.autocompleter.remove_many(prefixes)
+        self._cache.removed(prefixes)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Return the hit, miss and eviction counts of this engine's result
+        cache, and the number of results it currently holds.
+        """
+        return self._cache.stats()
+
+    def save(self, path: str) -> None:
+        """Save the melodies in this engine to the file at <path>, from which
+        load can start a new engine without reading the original input file.
+        """
+        _save(self, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> MelodyAutocompleteEngine:
+        """Return an engine answering queries from the file at <path>, which
+        was written by save.
+
+        If <mmap> is True, the file is memory-mapped and queries are answered
+        directly from the map. The new engine's Autocompleter is read-only, and
+        it does not cache results.
+        """
+        return _load(cls, path, mmap)
+
+
+def _save(engine: Any, path: str) -> None:
+    """Save the frozen form of <engine>'s Autocompleter to the file at <path>.
+    """
+    tree = engine.autocompleter
+    if not isinstance(tree, FrozenPrefixTree):
+        tree = tree.freeze()
+    tree.save(path)
+
+
+def _load(cls: type, path: str, mmap: bool) -> Any:
+    """Return a new engine of class <cls> whose Autocompleter is the frozen
+    tree saved in the file at <path>.
+    """
+    engine = cls.__new__(cls)
+    engine.autocompleter = FrozenPrefixTree.load(path, mmap)
+    engine._cache = ResultCache(0)
+    return engine
+
+
+def _read_counts(read: Callable[[str, int, Optional[int]], Dict[str, float]],
+                 path: str, workers: int) -> Dict[str, float]:
+    """Return the total weight of each sanitized string in the file at
+    <path>, as found by calling read(path, start, end) on ranges of its lines.
+
+    If <workers> > 1, the ranges are read by that many processes at once. A
+    compressed file cannot be split, and is always read by this process.
+    Only the reading is spread over the processes; the totals are combined,
+    and the prefix tree built from them, by this process.
+    """
+    if workers <= 1 or is_compressed(path):
+        return read(path, 0, None)
+    size = os.path.getsize(path)
+    ranges = _line_ranges(path, size, workers * _RANGES_PER_WORKER)
+    totals = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for counts in executor.map(read, repeat(path),
+                                   [start for start, _ in ranges],
+                                   [end for _, end in ranges]):
+            for value, weight in counts.items():
+                totals[value] = totals.get(value, 0) + weight
+    return totals
+
+
+def _line_ranges(path: str, size: int, parts: int) -> List[Tuple[int, int]]:
+    """Return up to <parts> non-empty (start, end) byte ranges that cover the
+    <size> bytes of the file at <path>, each made up of whole lines.
+    """
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for part in range(1, parts):
+            offset = size * part // parts
+            if offset <= bounds[-1]:
+                continue
+            # Move to the start of the next line.
+            f.seek(offset - 1)
+            f.readline()
+            if f.tell() >= size:
+                break
+            if f.tell() > bounds[-1]:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+
+def _read_letters(path: str, start: int,
+                  end: Optional[int]) -> Dict[str, float]:
+    """Return the number of times each sanitized line containing at least one
+    alphanumeric character occurs from byte <start> up to byte <end> (or the
+    end) of the file at <path>.
+
+    Each block of lines read is sanitized at once.
+    """
+    counts = {}
+    for block in iter_blocks(path, start, end):
+        for line in sanitize(block).split('\n'):
+            # After sanitizing, only whitespace can be left on a line
+            # without an alphanumeric character.
+            if line.strip():
+                counts[line] = counts.get(line, 0) + 1
+    return counts
+
+
+def _read_sentences(path: str, start: int,
+                    end: Optional[int]) -> Dict[str, float]:
+    """Return the total weight of each sanitized sentence containing at least
+    one word in the CSV rows from byte <start> up to byte <end> (or the end)
+    of the file at <path>. The words of a sentence are separated by single
+    spaces.
+    """
+    weights = {}
+    for row in csv.reader(iter_lines(path, start, end), delimiter=','):
+        _add_sentence(weights, row)
+    return weights
+
+
+def _csv_rows(text: str) -> Iterator[List[str]]:
+    """Yield the rows of the CSV <text>, skipping every row that the csv
+    module cannot parse (such as one with a field longer than
+    csv.field_size_limit()).
+    """
+    reader = csv.reader(io.StringIO(text), delimiter=',')
+    while True:
+        try:
+            yield next(reader)
+        except StopIteration:
+            return
+        except csv.Error:
+            continue
+
+
+def _add_sentence(weights: Dict[str, float], row: List[str]) -> None:
+    """Add the weight in the CSV <row> to the total in <weights> for the
+    sanitized sentence in <row>, if <row> has both and the sentence has at
+    least one word.
+
+    Raise ValueError if the weight is not a number.
+    """
+    if len(row) < 2:
+        return
+    sentence = ' '.join(words(row[0]))
+    if sentence:
+        weights[sentence] = weights.get(sentence, 0) + float(row[1])
+
+
+def _tree_class(config: Dict[str, Any]) -> type:
+    """Return the Autocompleter subclass named by config['autocompleter']."""
+    if config['autocompleter'] == 'simple':
+        return SimplePrefixTree
+    return CompressedPrefixTree
 
 
 ###############################################################################
@@ -380,15 +874,14 @@ def sample_melody_autocomplete() -> None:
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'allowed-io': ['__init__'],
-        'extra-imports': ['csv', 'prefix_tree', 'melody']
+        'allowed-io': ['__init__', 'follow', '_line_ranges'],
+        'extra-imports': ['csv', 'io', 'os', 'threading',
+                          'concurrent.futures', 'itertools',
+                          'chunked_reader', 'prefix_tree',
+                          'frozen_prefix_tree', 'melody', 'result_cache',
+                          'sanitize']
     })
 
-    # This is used to increase the recursion limit so that your sample runs
-    # work even for fairly tall simple prefix trees.
-    import sys
-    sys.setrecursionlimit(5000)
-
     # print(sample_letter_autocomplete())
     # print(sample_sentence_autocomplete())
     sample_melody_autocomplete()
@@ -0,0 +1,139 @@
+"""CSC148 Assignment 2: The Autocompleter ADT
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This file contains the design of the public interface (Autocompleter) that
+the trees in prefix_tree and frozen_prefix_tree implement, and the cursors
+that their autocomplete_page methods return. Both classes are imported into
+prefix_tree, so they can still be imported from there.
+"""
+from __future__ import annotations
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+
+################################################################################
+# The Autocompleter ADT
+################################################################################
+class Autocompleter:
+    """An abstract class representing the Autocompleter Abstract Data Type.
+    """
+    __slots__ = ()
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this Autocompleter."""
+        raise NotImplementedError
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Insert the given value into this Autocompleter.
+
+        The value is inserted with the given weight, and is associated with
+        the prefix sequence <prefix>.
+
+        If the value has already been inserted into this prefix tree
+        (compare values using ==), then the given weight should be *added* to
+        the existing weight of this value.
+
+        Preconditions:
+            weight > 0
+            The given value is either:
+                1) not in this Autocompleter
+                2) was previously inserted with the SAME prefix sequence
+        """
+        raise NotImplementedError
+
+    def autocomplete(self, prefix: List,
+                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix.
+
+        The return value is a list of tuples (value, weight), and must be
+        ordered in non-increasing weight. (You can decide how to break ties.)
+
+        If limit is None, return *every* match for the given prefix.
+
+        Precondition: limit is None or limit > 0.
+        """
+        raise NotImplementedError
+
+    def autocomplete_many(self, queries: Iterable[Tuple[List, Optional[int]]]
+                          ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete(prefix, limit) for each
+        (prefix, limit) pair in <queries>, in the same order.
+
+        Precondition: each limit is None or limit > 0.
+        """
+        return [self.autocomplete(prefix, limit) for prefix, limit in queries]
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield the matches for the given prefix as tuples (value, weight),
+        in non-increasing weight order.
+
+        This Autocompleter must not be changed while the matches are being
+        yielded.
+        """
+        yield from self.autocomplete(prefix)
+
+    def autocomplete_page(self, prefix: List, page_size: int,
+                          cursor: Optional[PageCursor] = None
+                          ) -> Tuple[List[Tuple[Any, float]],
+                                     Optional[PageCursor]]:
+        """Return the next <page_size> matches for the given prefix, and a
+        cursor for the page after them, or None if there are no more matches.
+
+        The matches are ordered as autocomplete would order them. If <cursor>
+        is None the first page is returned; otherwise <cursor> must have been
+        returned by an earlier call for the same prefix.
+
+        Raise ValueError if this Autocompleter has changed since <cursor> was
+        returned.
+
+        Precondition: page_size > 0.
+        """
+        raise NotImplementedError
+
+    def remove(self, prefix: List) -> None:
+        """Remove all values that match the given prefix.
+        """
+        raise NotImplementedError
+
+    def remove_many(self, prefixes: Iterable[List]) -> None:
+        """Remove all values that match any of the given prefixes.
+        """
+        for prefix in prefixes:
+            self.remove(prefix)
+
+
+class PageCursor:
+    """An opaque position in the matches for a prefix, returned by
+    autocomplete_page to fetch the page after it.
+
+    === Private Attributes ===
+    _tree: the Autocompleter the matches come from.
+    _version: the value of _tree._version when this cursor was created.
+    _prefix: the prefix the matches are for.
+    _frontier: the heap of subtrees the best-first search has yet to expand.
+    _pushed: the tie-breaking count for the next subtree pushed on the heap.
+    """
+    _tree: Autocompleter
+    _version: int
+    _prefix: List
+    _frontier: List[Tuple]
+    _pushed: int
+
+    def __init__(self, tree: Autocompleter, prefix: List,
+                 frontier: List[Tuple], pushed: int) -> None:
+        """Initialize a cursor for the matches of <prefix> in <tree> that are
+        still in <frontier>.
+        """
+        self._tree = tree
+        self._version = tree._version
+        self._prefix = prefix
+        self._frontier = frontier
+        self._pushed = pushed
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all()
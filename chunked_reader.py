@@ -0,0 +1,116 @@
+"""CSC148 Assignment 2: Chunked file reading
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module description ===
+This file contains the reader that the autocomplete engines use for their
+input files.
+
+A file is read with large binary reads and decoded from UTF-8 incrementally,
+so only one chunk of it (plus any line that runs past the end of the chunk) is
+in memory at a time. Files compressed with gzip or zstd are recognized by
+their first bytes and decompressed as they are read; zstd needs the optional
+zstandard package. Line endings are translated to '\\n' as they would be by a
+file opened in text mode.
+"""
+import codecs
+import gzip
+import io
+import itertools
+from typing import BinaryIO, Iterator, Optional
+
+# The number of bytes read from a file at a time.
+CHUNK_SIZE = 1 << 20
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def is_compressed(path: str) -> bool:
+    """Return whether the file at <path> is compressed with gzip or zstd."""
+    with open(path, 'rb') as f:
+        magic = f.read(len(_ZSTD_MAGIC))
+    return magic.startswith(_GZIP_MAGIC) or magic == _ZSTD_MAGIC
+
+
+def open_binary(path: str) -> BinaryIO:
+    """Return the file at <path> opened for reading bytes, decompressing it
+    as it is read if it is compressed with gzip or zstd.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(_ZSTD_MAGIC))
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.open(path, 'rb')
+    if magic == _ZSTD_MAGIC:
+        import zstandard
+        # A zstd file can hold several frames, as written by pzstd or by
+        # appending one compressed file to another.
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(path, 'rb'), closefd=True, read_across_frames=True)
+    return open(path, 'rb', buffering=0)
+
+
+def iter_blocks(path: str, start: int = 0, end: Optional[int] = None,
+                size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Yield the text of the UTF-8 file at <path> from byte <start> up to
+    byte <end> (or the end of the file) in blocks of whole lines, with each
+    line ending translated to '\\n'.
+
+    Every block but the last ends with '\\n'. A block is about <size>
+    characters long, unless a single line is longer than that.
+
+    Preconditions:
+        start and end are at the start of a line.
+        start == 0 and end is None if the file is compressed.
+        size > 0
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    remaining = end - start if end is not None else None
+    tail = ''
+    with open_binary(path) as f:
+        if start > 0:
+            f.seek(start)
+        while True:
+            if remaining is None:
+                chunk = f.read(size)
+            else:
+                chunk = f.read(min(size, remaining))
+                remaining -= len(chunk)
+            text = tail + decoder.decode(chunk, not chunk)
+            if not chunk:
+                if text:
+                    yield _translate(text)
+                return
+            # A '\r' at the very end could be the first half of a '\r\n'.
+            cut = max(text.rfind('\n'), text.rfind('\r', 0, len(text) - 1))
+            tail = text[cut + 1:]
+            if cut >= 0:
+                yield _translate(text[:cut + 1])
+
+
+def iter_lines(path: str, start: int = 0,
+               end: Optional[int] = None) -> Iterator[str]:
+    """Return an iterator over the lines of the UTF-8 file at <path> from
+    byte <start> up to byte <end> (or the end of the file), each ending in
+    '\\n' except perhaps the last.
+
+    This has the same preconditions as iter_blocks.
+    """
+    return itertools.chain.from_iterable(
+        map(io.StringIO, iter_blocks(path, start, end)))
+
+
+def _translate(text: str) -> str:
+    """Return <text> with each '\\r\\n' or '\\r' line ending replaced by '\\n'.
+    """
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['is_compressed', 'open_binary'],
+        'extra-imports': ['codecs', 'gzip', 'io', 'itertools', 'zstandard']
+    })
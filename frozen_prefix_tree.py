@@ -0,0 +1,490 @@
+"""CSC148 Assignment 2: Frozen prefix trees
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module description ===
+This file contains FrozenPrefixTree, a read-only Autocompleter returned by the
+freeze method of SimplePrefixTree and CompressedPrefixTree.
+
+A frozen tree keeps no tree objects. Its structure is stored in flat arrays
+from the array module, in compressed sparse row layout: the subtrees of each
+tree are numbered consecutively, so a tree only needs the offset of its first
+subtree. This takes a fraction of the memory of the tree it was frozen from,
+keeps related trees next to each other, and leaves nothing for the garbage
+collector to traverse.
+
+A frozen tree can be saved to a binary file and loaded back. A loaded tree can
+answer queries directly from a memory map of the file, so that processes
+loading the same file share its pages and start without rebuilding anything.
+
+The file starts with a header: the magic bytes b'PFXTREE\\0', the format
+version and flags as unsigned 32-bit integers, and the root's weight as a
+double. A table of (offset, length) pairs of unsigned 64-bit integers follows,
+one for each section of the file, in the order of _SECTIONS. Each section
+starts at a multiple of 8 bytes. The number sections hold the arrays of the
+tree, in the byte order given by the flags. The values and the labels are each
+stored as UTF-8 strings (an offsets section and a data section) if they are
+all strings, and pickled into the data section otherwise.
+"""
+from __future__ import annotations
+import heapq
+import itertools
+import mmap as mmap_module
+import pickle
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, \
+    Union, TYPE_CHECKING
+
+from autocompleter import Autocompleter, PageCursor
+if TYPE_CHECKING:
+    # Only imported for type checking, since prefix_tree imports this module.
+    from prefix_tree import SimplePrefixTree
+
+_MAGIC = b'PFXTREE\0'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<8sIId')
+_SECTION = struct.Struct('<QQ')
+# The sections of a saved tree, in order, with the array typecode of the
+# number sections.
+_SECTIONS = [('_child_start', 'q'), ('_label_start', 'q'), ('_label_ids', 'q'),
+             ('_leaf_start', 'q'), ('_weights', 'd'), ('_tops', 'd'),
+             ('_leaf_weights', 'd'), ('value offsets', 'q'),
+             ('value data', None), ('label offsets', 'q'),
+             ('label data', None)]
+# Flags
+_PICKLED_VALUES = 1
+_PICKLED_LABELS = 2
+_AVERAGE = 4
+_BIG_ENDIAN = 8
+
+
+class FrozenPrefixTree(Autocompleter):
+    """A read-only prefix tree stored in flat arrays.
+
+    The non-leaf trees are numbered in breadth-first order, starting from 0
+    for the root, and the leaves are numbered in the order of the trees they
+    are in.
+
+    === Attributes ===
+    weight_type:
+        The way the aggregate weight of the values in a tree is calculated.
+    weight:
+        The aggregate weight of all values in this tree, or 0.0 if this tree
+        is empty.
+
+    === Private Attributes ===
+    _child_start:
+        The non-leaf subtrees of tree i are the trees numbered from
+        _child_start[i] up to (but not including) _child_start[i + 1], in
+        increasing order of the id of the first element of their labels.
+    _label_start:
+        The label of tree i is the list of prefix elements whose ids are
+        _label_ids[_label_start[i]:_label_start[i + 1]]. The root's label is
+        its whole value; every other tree's value extends its parent's value
+        by its label.
+    _label_ids:
+        The ids of the elements of every tree's label, one label after
+        another.
+    _leaf_start:
+        The leaves in the subtrees of tree i are the leaves numbered from
+        _leaf_start[i] up to (but not including) _leaf_start[i + 1], in
+        non-increasing weight order.
+    _weights:
+        The aggregate weight of each non-leaf tree.
+    _tops:
+        The largest leaf weight in each non-leaf tree, or 0.0 if it is empty.
+    _leaf_weights:
+        The weight of each leaf.
+    _values:
+        The value stored in each leaf.
+    _labels:
+        Every distinct prefix element in this tree, indexed by its id.
+    _label_index:
+        Maps each prefix element in _labels to its id.
+    _version:
+        Always 0, since a frozen tree never changes. Cursors returned by
+        autocomplete_page compare it like they would a prefix tree's.
+
+    The number arrays are memoryviews of the file instead of arrays if this
+    tree was loaded with mmap=True, and _values is then a _StringTable if the
+    values are strings.
+    """
+    weight_type: str
+    weight: float
+    _child_start: Union[array, memoryview]
+    _label_start: Union[array, memoryview]
+    _label_ids: Union[array, memoryview]
+    _leaf_start: Union[array, memoryview]
+    _weights: Union[array, memoryview]
+    _tops: Union[array, memoryview]
+    _leaf_weights: Union[array, memoryview]
+    _values: Sequence[Any]
+    _labels: List[Any]
+    _label_index: Dict[Any, int]
+    _version: int
+
+    def __init__(self, tree: SimplePrefixTree) -> None:
+        """Initialize a frozen copy of <tree>, which must be the root of a
+        SimplePrefixTree or CompressedPrefixTree.
+        """
+        self.weight_type = tree.weight_type
+        self.weight = tree.weight
+        self._child_start = array('q')
+        self._label_start = array('q')
+        self._label_ids = array('q')
+        self._leaf_start = array('q')
+        self._weights = array('d')
+        self._tops = array('d')
+        self._leaf_weights = array('d')
+        self._values = []
+        self._labels = []
+        self._label_index = {}
+        self._version = 0
+
+        queue = [tree]
+        for i, node in enumerate(queue):
+            label = node.value if i == 0 else node._edge_label()
+            self._label_start.append(len(self._label_ids))
+            self._label_ids.extend(self._label_id(x) for x in label)
+            self._leaf_start.append(len(self._values))
+            children = []
+            for subtree in node.subtrees:
+                if subtree.is_leaf():
+                    self._leaf_weights.append(subtree.weight)
+                    self._values.append(subtree.value)
+                else:
+                    children.append(subtree)
+            children.sort(key=lambda x: self._label_id(x._edge_key()))
+            self._child_start.append(len(queue))
+            queue.extend(children)
+            self._weights.append(node.weight)
+            self._tops.append(node._top_weight())
+        self._child_start.append(len(queue))
+        self._label_start.append(len(self._label_ids))
+        self._leaf_start.append(len(self._values))
+
+    def _label_id(self, element: Any) -> int:
+        """Return the id of the prefix element <element>, giving it a new id
+        if it does not have one yet.
+        """
+        if element not in self._label_index:
+            self._label_index[element] = len(self._labels)
+            self._labels.append(element)
+        return self._label_index[element]
+
+    def save(self, path: str) -> None:
+        """Write this tree to the file at <path>, in the format described in
+        the module docstring.
+        """
+        flags = _BIG_ENDIAN if sys.byteorder == 'big' else 0
+        if self.weight_type == 'average':
+            flags |= _AVERAGE
+        value_offsets, value_data, pickled = _encode_table(self._values)
+        if pickled:
+            flags |= _PICKLED_VALUES
+        label_offsets, label_data, pickled = _encode_table(self._labels)
+        if pickled:
+            flags |= _PICKLED_LABELS
+        sections = [bytes(getattr(self, name)) for name, _ in _SECTIONS[:7]]
+        sections.extend([value_offsets, value_data, label_offsets, label_data])
+
+        table = []
+        offset = _HEADER.size + _SECTION.size * len(sections)
+        for section in sections:
+            offset += -offset % 8
+            table.append(_SECTION.pack(offset, len(section)))
+            offset += len(section)
+        with open(path, 'wb') as file:
+            file.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, flags,
+                                    self.weight))
+            file.write(b''.join(table))
+            for section in sections:
+                file.write(bytes(-file.tell() % 8))
+                file.write(section)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> FrozenPrefixTree:
+        """Return the tree saved in the file at <path>.
+
+        If <mmap> is True, the file is memory-mapped and the tree's arrays
+        are read from the map as they are used, instead of being copied into
+        memory; string values are only decoded when they are returned.
+
+        Raise ValueError if the file is not a saved prefix tree, or was saved
+        in a format version that this module does not know.
+        """
+        with open(path, 'rb') as file:
+            if mmap:
+                buffer = mmap_module.mmap(file.fileno(), 0,
+                                          access=mmap_module.ACCESS_READ)
+            else:
+                buffer = file.read()
+        view = memoryview(buffer)
+        if len(view) < _HEADER.size:
+            raise ValueError(f'{path} is not a saved prefix tree')
+        magic, version, flags, weight = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError(f'{path} is not a saved prefix tree')
+        if version != _FORMAT_VERSION:
+            raise ValueError(f'{path} has unsupported format version '
+                             f'{version}')
+        if len(view) < _HEADER.size + _SECTION.size * len(_SECTIONS):
+            raise ValueError(f'{path} is not a saved prefix tree')
+        swap = bool(flags & _BIG_ENDIAN) != (sys.byteorder == 'big')
+
+        sections = {}
+        for i, (name, typecode) in enumerate(_SECTIONS):
+            offset, length = _SECTION.unpack_from(
+                view, _HEADER.size + i * _SECTION.size)
+            # A truncated file has sections that run past its end, and a
+            # corrupted one may have number sections of a partial number.
+            item_size = 1 if typecode is None else array(typecode).itemsize
+            if offset + length > len(view) or length % item_size != 0:
+                raise ValueError(f'{path} is not a saved prefix tree')
+            section = view[offset:offset + length]
+            if typecode is None:
+                sections[name] = section
+            elif mmap and not swap:
+                sections[name] = section.cast(typecode)
+            else:
+                numbers = array(typecode)
+                numbers.frombytes(section)
+                if swap:
+                    numbers.byteswap()
+                sections[name] = numbers
+
+        tree = cls.__new__(cls)
+        tree.weight_type = 'average' if flags & _AVERAGE else 'sum'
+        tree.weight = weight
+        for name, _ in _SECTIONS[:7]:
+            setattr(tree, name, sections[name])
+        if flags & _PICKLED_VALUES:
+            tree._values = pickle.loads(sections['value data'])
+        else:
+            tree._values = _StringTable(sections['value offsets'],
+                                        sections['value data'])
+        if flags & _PICKLED_LABELS:
+            tree._labels = pickle.loads(sections['label data'])
+        else:
+            tree._labels = list(_StringTable(sections['label offsets'],
+                                             sections['label data']))
+        tree._label_index = {x: i for i, x in enumerate(tree._labels)}
+        tree._version = 0
+        return tree
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this tree."""
+        return len(self._values)
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Raise TypeError, since a frozen tree cannot be changed."""
+        raise TypeError('a frozen prefix tree cannot be changed')
+
+    def remove(self, prefix: List) -> None:
+        """Raise TypeError, since a frozen tree cannot be changed."""
+        raise TypeError('a frozen prefix tree cannot be changed')
+
+    def remove_many(self, prefixes: List[List]) -> None:
+        """Raise TypeError, since a frozen tree cannot be changed."""
+        raise TypeError('a frozen prefix tree cannot be changed')
+
+    def autocomplete(self, prefix: List,
+                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix.
+
+        The return value is a list of tuples (value, weight), ordered in
+        non-increasing weight.
+
+        If limit is None, return *every* match for the given prefix.
+
+        Precondition: limit is None or limit > 0.
+        """
+        return list(itertools.islice(self.iter_autocomplete(prefix), limit))
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield the matches for the given prefix as tuples (value, weight),
+        in non-increasing weight order.
+        """
+        node = self._locate(prefix)
+        if node < 0:
+            return iter(())
+        return self._search(self._frontier(node), itertools.count(1))
+
+    def autocomplete_page(self, prefix: List, page_size: int,
+                          cursor: Optional[PageCursor] = None
+                          ) -> Tuple[List[Tuple[Any, float]],
+                                     Optional[PageCursor]]:
+        """Return the next <page_size> matches for the given prefix, and a
+        cursor for the page after them, or None if there are no more matches.
+
+        If <cursor> is None the first page is returned; otherwise <cursor>
+        must have been returned by an earlier call for the same prefix.
+
+        Raise ValueError if <cursor> was returned for a different prefix or
+        by a different tree.
+
+        Precondition: page_size > 0.
+        """
+        prefix = list(prefix)
+        if cursor is None:
+            node = self._locate(prefix)
+            frontier = [] if node < 0 else self._frontier(node)
+            pushed = 1
+        elif cursor._tree is not self or cursor._prefix != prefix:
+            raise ValueError('cursor was returned for a different prefix')
+        else:
+            frontier = list(cursor._frontier)
+            pushed = cursor._pushed
+
+        counter = itertools.count(pushed)
+        search = self._search(frontier, counter)
+        page = list(itertools.islice(search, page_size))
+        if not frontier:
+            return page, None
+        return page, PageCursor(self, prefix, frontier, next(counter))
+
+    def _locate(self, prefix: List) -> int:
+        """Return the number of the smallest tree that contains every value
+        matching <prefix>, or -1 if no value in this tree matches <prefix>.
+        """
+        root_length = self._label_start[1] - self._label_start[0]
+        depth = self._match(0, prefix, 0)
+        if depth < root_length and depth < len(prefix):
+            return -1
+        node = 0
+        while depth < len(prefix):
+            node = self._child(node, self._label_index.get(prefix[depth]))
+            if node < 0:
+                return -1
+            common = self._match(node, prefix, depth)
+            length = self._label_start[node + 1] - self._label_start[node]
+            if common < length and depth + common < len(prefix):
+                return -1
+            depth += common
+        return node
+
+    def _match(self, node: int, prefix: List, depth: int) -> int:
+        """Return the length of the longest common prefix of the label of tree
+        <node> and prefix[depth:].
+        """
+        start = self._label_start[node]
+        length = min(self._label_start[node + 1] - start, len(prefix) - depth)
+        common = 0
+        while common < length and self._label_ids[start + common] == \
+                self._label_index.get(prefix[depth + common]):
+            common += 1
+        return common
+
+    def _child(self, node: int, key: Optional[int]) -> int:
+        """Return the number of the non-leaf subtree of tree <node> whose label
+        starts with the element with id <key>, or -1 if there is none.
+        """
+        if key is None:
+            return -1
+        low = self._child_start[node]
+        high = self._child_start[node + 1]
+        while low < high:
+            mid = (low + high) // 2
+            first = self._label_ids[self._label_start[mid]]
+            if first < key:
+                low = mid + 1
+            elif first > key:
+                high = mid
+            else:
+                return mid
+        return -1
+
+    def _frontier(self, node: int) -> List[Tuple[float, int, int, int]]:
+        """Return the starting frontier of a best-first search of tree <node>.
+        """
+        return [(-self._tops[node], 0, node, 0)]
+
+    def _search(self, frontier: List[Tuple[float, int, int, int]],
+                counter: Iterator[int]) -> Iterator[Tuple[Any, float]]:
+        """Yield the values in the trees on <frontier> with their weights, in
+        non-increasing weight order, by a best-first search.
+
+        <frontier> is a heap, updated in place, of entries
+        (-weight, -count, item, end). For a non-leaf tree, item is its number
+        and weight its largest leaf weight. For a leaf, item is ~(its number),
+        and end is the end of the range of leaves it is in: only the first
+        unvisited leaf of each range is on the heap at a time.
+        """
+        while frontier:
+            _, _, item, end = heapq.heappop(frontier)
+            if item < 0:
+                leaf = ~item
+                yield self._values[leaf], self._leaf_weights[leaf]
+                if leaf + 1 < end:
+                    heapq.heappush(frontier,
+                                   (-self._leaf_weights[leaf + 1],
+                                    -next(counter), ~(leaf + 1), end))
+            else:
+                start = self._leaf_start[item]
+                stop = self._leaf_start[item + 1]
+                if start < stop:
+                    heapq.heappush(frontier, (-self._leaf_weights[start],
+                                              -next(counter), ~start, stop))
+                for child in reversed(range(self._child_start[item],
+                                            self._child_start[item + 1])):
+                    heapq.heappush(frontier, (-self._tops[child],
+                                              -next(counter), child, 0))
+
+
+class _StringTable:
+    """A read-only sequence of strings, stored one after another as UTF-8
+    in a single buffer and decoded only when they are accessed.
+
+    === Private Attributes ===
+    _offsets:
+        String i is stored in _data[_offsets[i]:_offsets[i + 1]].
+    _data:
+        The UTF-8 encoding of every string, one after another.
+    """
+    _offsets: Union[array, memoryview]
+    _data: memoryview
+
+    def __init__(self, offsets: Union[array, memoryview],
+                 data: memoryview) -> None:
+        """Initialize a table of the strings in <data> at <offsets>."""
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self) -> int:
+        """Return the number of strings in this table."""
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        """Return string i of this table."""
+        if not 0 <= i < len(self):
+            raise IndexError('string table index out of range')
+        start = self._offsets[i]
+        return str(self._data[start:self._offsets[i + 1]], 'utf-8')
+
+
+def _encode_table(items: Sequence[Any]) -> Tuple[bytes, bytes, bool]:
+    """Return the offsets and data sections storing <items>, and whether the
+    items had to be pickled because they are not all strings.
+    """
+    if isinstance(items, _StringTable):
+        return bytes(items._offsets), bytes(items._data), False
+    if not all(isinstance(item, str) for item in items):
+        return b'', pickle.dumps(list(items), pickle.HIGHEST_PROTOCOL), True
+    encoded = [item.encode('utf-8') for item in items]
+    offsets = array('q', [0])
+    for item in encoded:
+        offsets.append(offsets[-1] + len(item))
+    return bytes(offsets), b''.join(encoded), False
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['save', 'load'],
+        'extra-imports': ['heapq', 'itertools', 'mmap', 'pickle', 'struct',
+                          'sys', 'array', 'autocompleter', 'prefix_tree']
+    })
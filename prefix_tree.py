@@ -5,8 +5,9 @@ Department of Computer Science,
 University of Toronto
 
 === Module Description ===
-This file contains the design of a public interface (Autocompleter) and two
-implementation of this interface, SimplePrefixTree and CompressedPrefixTree.
+This file contains two implementations of the public interface
+(Autocompleter, whose design is in autocompleter.py), SimplePrefixTree and
+CompressedPrefixTree.
 You'll complete both of these subclasses over the course of this assignment.
 
 As usual, be sure not to change any parts of the given *public interface* in the
@@ -15,54 +16,18 @@ testing directly! You may, however, add new private attributes, methods, and
 top-level functions to this file.
 """
 from __future__ import annotations
-from typing import Any, List, Optional, Tuple
+import heapq
+import itertools
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, \
+    Sequence, Tuple
 
+from autocompleter import Autocompleter, PageCursor
+from frozen_prefix_tree import FrozenPrefixTree
 
-################################################################################
-# The Autocompleter ADT
-################################################################################
-class Autocompleter:
-    """An abstract class representing the Autocompleter Abstract Data Type.
-    """
-    def __len__(self) -> int:
-        """Return the number of values stored in this Autocompleter."""
-        raise NotImplementedError
-
-    def insert(self, value: Any, weight: float, prefix: List) -> None:
-        """Insert the given value into this Autocompleter.
-
-        The value is inserted with the given weight, and is associated with
-        the prefix sequence <prefix>.
-
-        If the value has already been inserted into this prefix tree
-        (compare values using ==), then the given weight should be *added* to
-        the existing weight of this value.
-
-        Preconditions:
-            weight > 0
-            The given value is either:
-                1) not in this Autocompleter
-                2) was previously inserted with the SAME prefix sequence
-        """
-        raise NotImplementedError
-
-    def autocomplete(self, prefix: List,
-                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
-        """Return up to <limit> matches for the given prefix.
-
-        The return value is a list of tuples (value, weight), and must be
-        ordered in non-increasing weight. (You can decide how to break ties.)
-
-        If limit is None, return *every* match for the given prefix.
-
-        Precondition: limit is None or limit > 0.
-        """
-        raise NotImplementedError
-
-    def remove(self, prefix: List) -> None:
-        """Remove all values that match the given prefix.
-        """
-        raise NotImplementedError
+# A tree with at most this many subtrees finds its non-leaf subtree for a
+# prefix element by scanning them, instead of building a _children dictionary.
+_CHILD_SCAN_LIMIT = 8
 
 
 ################################################################################
@@ -89,6 +54,46 @@ class SimplePrefixTree(Autocompleter):
     weight_type:
         The way the aggregate weight of the values in a tree is calculated
 
+    === Private Attributes ===
+    _count:
+        The number of leaves in this tree, kept up to date by insert and
+        remove so that len() is constant-time. Only maintained for non-leaf
+        trees.
+    _sum:
+        The sum of the leaf weights in this tree. Only maintained for
+        non-leaf trees.
+    _max:
+        The largest weight of a leaf in this tree, or 0.0 if this tree is
+        empty. Only maintained for non-leaf trees; see _top_weight.
+    _label:
+        The part of self.value this tree stores itself. For a leaf or a tree
+        without a parent this is the whole value; for any other tree it is
+        the single prefix element x that its parent's value is extended by.
+    _parent:
+        The tree that has this tree in its subtrees, or None if this tree is
+        the root.
+    _children:
+        The non-leaf trees in self.subtrees, keyed by their _label, so that
+        the subtree for the next prefix element is found without a scan, or
+        None if it has not been built. It is only built once this tree has
+        more than _CHILD_SCAN_LIMIT subtrees; see _child.
+    _leaves:
+        A dictionary mapping every (hashable) value in this tree to the leaf
+        that stores it, or None if it has not been built yet. Only the tree
+        that insert is called on builds one.
+    _top_k:
+        How many of the heaviest leaves each non-leaf tree keeps in _top, or
+        0 if these caches are not kept. Only set on the root.
+    _top:
+        The (up to) _top_k heaviest leaves in this tree, in non-increasing
+        weight order, so that autocomplete with limit <= _top_k is answered
+        without a search. Only maintained for non-leaf trees, and only if the
+        root's _top_k > 0; every other tree shares the empty tuple.
+    _version:
+        The number of times insert, remove, remove_many or merge has been
+        called on this tree, so that cursors from autocomplete_page can tell
+        when they are stale.
+
     === Representation invariants ===
     - self.weight >= 0
 
@@ -115,12 +120,23 @@ class SimplePrefixTree(Autocompleter):
       both can appear in the same self.subtrees list, and both have a `weight`
       attribute.
     """
-    value: Any
     weight: float
     subtrees: List[SimplePrefixTree]
     weight_type: str
-
-    def __init__(self, weight_type: str) -> None:
+    _label: Any
+    _parent: Optional[SimplePrefixTree]
+    _children: Optional[Dict[Any, SimplePrefixTree]]
+    _leaves: Optional[Dict[Any, SimplePrefixTree]]
+    _top_k: int
+    _top: Sequence[SimplePrefixTree]
+    _version: int
+    # A prefix tree is made of many small trees, so each keeps its attributes
+    # in slots instead of a dictionary of its own.
+    __slots__ = ('_label', '_parent', 'subtrees', 'weight', 'weight_type',
+                 '_children', '_leaves', '_count', '_sum', '_max', '_top_k',
+                 '_top', '_version')
+
+    def __init__(self, weight_type: str, top_k: int = 0) -> None:
         """Initialize an empty simple prefix tree.
 
         Precondition: weight_type == 'sum' or weight_type == 'average'.
@@ -128,24 +144,284 @@ class SimplePrefixTree(Autocompleter):
         The given <weight_type> value specifies how the aggregate weight
         of non-leaf trees should be calculated (see the assignment handout
         for details).
+
+        If <top_k> > 0, every non-leaf tree keeps its <top_k> heaviest leaves,
+        so that autocomplete with a limit of at most <top_k> is a single
+        descent followed by a slice.
         """
+        self._parent = None
         self.value = []
         self.subtrees = []
         self.weight = 0.0
         self.weight_type = weight_type
+        self._children = None
+        self._leaves = None
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._top_k = top_k
+        self._top = ()
+        self._version = 0
+
+    @classmethod
+    def from_items(cls, weight_type: str,
+                   items: Iterable[Tuple[Any, float, List]],
+                   top_k: int = 0) -> SimplePrefixTree:
+        """Return a new prefix tree of this class containing <items>.
+
+        Each item is a (value, weight, prefix) triple, as would be passed to
+        insert; a value that appears more than once gets the sum of its
+        weights. This is much faster than inserting the items one at a time:
+        the items are sorted by prefix once and the tree is built in a single
+        pass, computing each tree's aggregates and ordering its subtrees only
+        when all of its values have been added.
+
+        <top_k> is passed on to the new tree's initializer.
+
+        Preconditions:
+            weight_type == 'sum' or weight_type == 'average'
+            Every weight is > 0, and every value appears with only one prefix.
+            The prefix elements can be compared with <.
+
+        >>> tree = SimplePrefixTree.from_items('sum', [
+        ...     ('car', 3.0, ['c', 'a', 'r']),
+        ...     ('cat', 2.0, ['c', 'a', 't']),
+        ...     ('car', 1.0, ['c', 'a', 'r'])])
+        >>> tree.autocomplete(['c'])
+        [('car', 4.0), ('cat', 2.0)]
+        """
+        totals = {}
+        unhashable = []
+        for value, weight, prefix in items:
+            try:
+                if value in totals:
+                    totals[value][1] += weight
+                else:
+                    totals[value] = [value, weight, prefix]
+            except TypeError:
+                for entry in unhashable:
+                    if entry[0] == value:
+                        entry[1] += weight
+                        break
+                else:
+                    unhashable.append([value, weight, prefix])
+        entries = list(totals.values()) + unhashable
+        entries.sort(key=lambda entry: entry[2])
+
+        root = cls(weight_type, top_k)
+        root._leaves = {}
+        # path[i] is a tree for previous[:ends[i]] that values are being added
+        # to; trees leave the path, complete, as soon as a prefix diverges.
+        path = [root]
+        ends = [0]
+        previous = []
+        for value, weight, prefix in entries:
+            common = _common_length(previous, prefix, 0)
+            while len(path) > 1 and ends[-2] >= common:
+                tree = path.pop()
+                ends.pop()
+                tree._finish()
+                path[-1]._adopt(tree)
+            if ends[-1] > common:
+                # prefix leaves the last tree's edge part way along, which
+                # only happens to compressed trees: the part of the edge
+                # after <common> becomes a complete tree of its own.
+                tree = path[-1]
+                middle = path[-2]._open(previous[:common], ends[-2])
+                tree._label = tree._label[common - ends[-2]:]
+                tree._parent = middle
+                tree._finish()
+                middle._adopt(tree)
+                path[-1] = middle
+                ends[-1] = common
+            while ends[-1] < len(prefix):
+                path.append(path[-1]._open(prefix, ends[-1]))
+                ends.append(ends[-1] + len(path[-1]._edge_label()))
+            leaf = cls(weight_type)
+            leaf.value = value
+            leaf.weight = weight
+            leaf._parent = path[-1]
+            path[-1].subtrees.append(leaf)
+            try:
+                root._leaves[value] = leaf
+            except TypeError:
+                pass
+            previous = prefix
+        while len(path) > 1:
+            tree = path.pop()
+            tree._finish()
+            path[-1]._adopt(tree)
+        root._finish()
+        if top_k > 0:
+            root._fill_tops()
+        return root
+
+    def _open(self, prefix: List, depth: int) -> SimplePrefixTree:
+        """Return a new, empty subtree of this tree whose value extends this
+        tree's value (prefix[:depth]) towards <prefix>, without adding it to
+        self.subtrees yet.
+
+        A simple prefix tree's subtree extends it by prefix[depth] alone.
+
+        Precondition: self.value == prefix[:depth].
+        """
+        subtree = type(self)(self.weight_type)
+        subtree._label = prefix[depth]
+        subtree._parent = self
+        return subtree
+
+    def _adopt(self, subtree: SimplePrefixTree) -> None:
+        """Add the completed <subtree>, created by _open, to this tree."""
+        self.subtrees.append(subtree)
+        self._index_child(subtree)
+
+    def _child(self, key: Any) -> Optional[SimplePrefixTree]:
+        """Return the non-leaf subtree of this tree whose _edge_key is <key>,
+        or None if there is no such subtree.
+
+        A tree with only a few subtrees (most trees, deep in a prefix tree)
+        scans them; the _children dictionary of any other tree is built on
+        first use, and kept up to date from then on.
+        """
+        if self._children is None:
+            if len(self.subtrees) <= _CHILD_SCAN_LIMIT:
+                for subtree in self.subtrees:
+                    if not subtree.is_leaf() and subtree._edge_key() == key:
+                        return subtree
+                return None
+            self._children = {subtree._edge_key(): subtree
+                              for subtree in self.subtrees
+                              if not subtree.is_leaf()}
+        return self._children.get(key)
+
+    def _index_child(self, subtree: SimplePrefixTree) -> None:
+        """Record the non-leaf <subtree>, just added to self.subtrees, in
+        this tree's _children, if it has been built.
+        """
+        if self._children is not None:
+            self._children[subtree._edge_key()] = subtree
+
+    def _unindex_child(self, subtree: SimplePrefixTree) -> None:
+        """Drop the non-leaf <subtree> from this tree's _children, if it has
+        been built.
+        """
+        if self._children is not None:
+            del self._children[subtree._edge_key()]
+
+    def _edge_label(self) -> List:
+        """Return the list of prefix elements that this tree's value extends
+        its parent's value by.
+        """
+        return [self._label]
+
+    def _edge_key(self) -> Any:
+        """Return the key this non-leaf tree has in its parent's _children."""
+        return self._label
+
+    def _finish(self) -> None:
+        """Compute the aggregates of this tree and sort its subtrees once all
+        of its values have been added.
+        """
+        self._refresh()
+        self.subtrees.sort(key=lambda x: x.weight, reverse=True)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Return the state of the tree rooted at this tree, for pickling.
+
+        The trees are listed in preorder in one pass without recursion, and
+        stored in flat lists and arrays: the number of subtrees of each
+        non-leaf tree (-1 for a leaf), the label of each non-leaf tree below
+        this one, and the value and weight of each leaf. The aggregates are
+        left out and recomputed when unpickling.
+        """
+        shape = array('q')
+        labels = []
+        values = []
+        weights = array('d')
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree.is_leaf():
+                shape.append(-1)
+                values.append(tree.value)
+                weights.append(tree.weight)
+            else:
+                shape.append(len(tree.subtrees))
+                if tree is not self:
+                    labels.append(tree._label)
+                stack.extend(reversed(tree.subtrees))
+        return {'weight_type': self.weight_type, 'top_k': self._top_k,
+                'value': self.value, 'shape': shape, 'labels': labels,
+                'values': values, 'weights': weights}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Rebuild this tree from <state>, as returned by __getstate__.
+        """
+        self.__init__(state['weight_type'], state['top_k'])
+        shape = state['shape']
+        values = iter(state['values'])
+        weights = iter(state['weights'])
+        labels = iter(state['labels'])
+        self.value = state['value']
+        if shape[0] < 0:
+            self.value = next(values)
+            self.weight = next(weights)
+            return
+
+        trees = [self]
+        # Each entry is a non-leaf tree that is still missing subtrees, with
+        # the number of subtrees it is missing.
+        stack = [[self, shape[0]]]
+        for size in itertools.islice(shape, 1, None):
+            parent = stack[-1][0]
+            tree = type(self)(self.weight_type)
+            tree._parent = parent
+            parent.subtrees.append(tree)
+            if size < 0:
+                tree.value = next(values)
+                tree.weight = next(weights)
+            else:
+                tree._label = next(labels)
+                parent._index_child(tree)
+                trees.append(tree)
+            stack[-1][1] -= 1
+            while stack and stack[-1][1] == 0:
+                stack.pop()
+            if size > 0:
+                stack.append([tree, size])
+        for tree in reversed(trees):
+            tree._refresh()
+        if self._top_k > 0:
+            self._fill_tops()
+
+    @property
+    def value(self) -> Any:
+        """The value stored at the root of this prefix tree.
+
+        Only the last element of an internal tree's prefix is stored on the
+        tree itself, so its value is rebuilt from the labels on the path
+        from the root.
+        """
+        if self._parent is None or self.is_leaf():
+            return self._label
+        labels = []
+        tree = self
+        while tree._parent is not None:
+            labels.append(tree._label)
+            tree = tree._parent
+        labels.reverse()
+        return tree._label + labels
+
+    @value.setter
+    def value(self, value: Any) -> None:
+        self._label = value
 
     def __len__(self) -> int:
         """Return the number of values stored in this Autocompleter."""
 
-        if self.is_empty():
-            return 0
-        elif self.is_leaf():
+        if self.is_leaf():
             return 1
-        else:
-            counter = 0
-            for subtree in self.subtrees:
-                counter += len(subtree)
-            return counter
+        return self._count
 
     def insert(self, value: Any, weight: float, prefix: List) -> None:
         """Insert the given value into this Autocompleter.
@@ -170,102 +446,226 @@ class SimplePrefixTree(Autocompleter):
         [] (40.0)
          park (40.0)
         """
-        new = SimplePrefixTree(self.weight_type)
-        if prefix == []:
-            new.value = value
-            new.weight = weight
-            self.subtrees.append(new)
-        else:
-            if self.is_leaf() and self.value == value:
-                self.weight += weight
-            elif self.value == prefix and len(self.subtrees) != 0:
-                for subtree in self.subtrees:
-                    if subtree.is_leaf and subtree.value == value:
-                        subtree.weight += weight
-                        self.weight += weight
+        self._version += 1
+        try:
+            changed = self._leaf_index().get(value)
+            indexed = True
+        except TypeError:
+            changed, indexed = None, False
+
+        if changed is None:
+            tree = self._insertion_point(prefix)
+            if not indexed:
+                for subtree in tree.subtrees:
+                    if subtree.is_leaf() and subtree.value == value:
+                        changed = subtree
                         break
 
-            elif self.value == prefix and len(self.subtrees) == 0:
-                new.value = value
-                new.weight = weight
-                self.subtrees.append(new)
-            else:
-                new_prefix = self.value + [prefix[len(self.value)]]
-                inside = False
-                for subtree in self.subtrees:
-                    if new_prefix == subtree.value:
-                        subtree.insert(value, weight, prefix)
-                        inside = True
-                if not inside:
-                    self.subtrees.append(new)
-                new.value = new_prefix
-                new.insert(value, weight, prefix)
-        if self.weight_type == 'sum':
-            self.weight += new.weight
+        if changed is None:
+            changed = type(self)(self.weight_type)
+            changed.value = value
+            changed.weight = weight
+            changed._parent = tree
+            if indexed:
+                self._leaves[value] = changed
+            self._update_path(tree, changed, 1, weight)
         else:
-            leaves = self._num_leaves()
-            leaves_weight = self._sum_leaves()
-            self.weight = leaves_weight / leaves
-        self.subtrees.sort(key=lambda x: x.weight, reverse=True)
+            tree = changed._parent
+            tree._take_subtree(changed)
+            changed.weight += weight
+            self._update_path(tree, changed, 0, weight)
 
-    def _inserted(self, value: Any, weight: float, prefix: List) -> bool:
-        if self.is_leaf():
-            return self.value == value
-        else:
-            for subtree in self.subtrees:
-                if subtree._inserted(value, weight, prefix) is True:
-                    return True
-            return False
+    def _insertion_point(self, prefix: List) -> SimplePrefixTree:
+        """Return the tree whose value is <prefix>, creating the missing trees
+        on the way down to it.
+
+        Each new tree is added to its parent's subtrees with weight 0, to be
+        moved into place when _update_path gives it its first value.
+        """
+        tree = self
+        for depth in range(len(self.value), len(prefix)):
+            subtree = tree._child(prefix[depth])
+            if subtree is None:
+                subtree = SimplePrefixTree(self.weight_type)
+                subtree._label = prefix[depth]
+                subtree._parent = tree
+                tree._order_weight(subtree)
+                tree._index_child(subtree)
+            tree = subtree
+        return tree
+
+    def _update_path(self, tree: SimplePrefixTree, changed: SimplePrefixTree,
+                     added: int, weight: float) -> None:
+        """Update the aggregates of <tree> and of its ancestors up to this tree
+        after <weight> was added to the leaf weights below <changed>, and
+        <added> new leaves were inserted there.
+
+        <changed> has already been taken out of tree.subtrees; each tree on
+        the path is taken out of its own parent's subtrees before its weight
+        changes, and put back in order afterwards.
+
+        Since leaf weights only grow here, the leaf below <changed> is simply
+        moved up (or into) each top-k cache on the path.
+        """
+        leaf = changed
+        while True:
+            parent = tree._parent if tree is not self else None
+            if parent is not None:
+                parent._take_subtree(tree)
+            tree._count += added
+            tree._sum += weight
+            tree._max = max(tree._max, changed._top_weight())
+            tree._set_weight()
+            tree._order_weight(changed)
+            if self._top_k > 0:
+                tree._raise_top(leaf, self._top_k)
+            if parent is None:
+                return
+            changed, tree = tree, parent
+
+    def _raise_top(self, leaf: SimplePrefixTree, k: int) -> None:
+        """Update this tree's top-k cache after the weight of <leaf>, a leaf
+        in this tree, went up.
+
+        Precondition: k > 0
+        """
+        if not self._top:
+            # This tree may still have the shared empty tuple.
+            self._top = [leaf]
+            return
+        if leaf in self._top:
+            self._top.remove(leaf)
+        i = 0
+        while i < len(self._top) and self._top[i].weight >= leaf.weight:
+            i += 1
+        if i < k:
+            self._top.insert(i, leaf)
+            del self._top[k:]
+
+    def _merge_top(self, k: int) -> None:
+        """Recompute this tree's top-k cache from its subtrees."""
+        candidates = []
+        for subtree in self.subtrees:
+            if subtree.is_leaf():
+                candidates.append(subtree)
+            else:
+                candidates.extend(subtree._top)
+        self._top = heapq.nlargest(k, candidates, key=lambda x: x.weight)
+
+    def _fill_tops(self) -> None:
+        """Compute the top-k cache of every non-leaf tree in this tree."""
+        trees = []
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            trees.append(tree)
+            for subtree in tree.subtrees:
+                if not subtree.is_leaf():
+                    stack.append(subtree)
+        for tree in reversed(trees):
+            tree._merge_top(self._top_k)
+
+    def _leaf_index(self) -> Dict[Any, SimplePrefixTree]:
+        """Return the dictionary mapping each value in this tree to its leaf,
+        building it on first use.
+        """
+        if self._leaves is None:
+            self._leaves = {}
+            stack = [self]
+            while stack:
+                tree = stack.pop()
+                for subtree in tree.subtrees:
+                    if subtree.is_leaf():
+                        self._index_leaf(subtree)
+                    else:
+                        stack.append(subtree)
+        return self._leaves
 
     def _weighting(self) -> float:
+        """Recompute the aggregates of this tree from scratch, and return its
+        weight.
+        """
         if self.is_leaf():
             return self.weight
+        # Visit the non-leaf trees in preorder, then recompute them in reverse
+        # so that every tree's subtrees are done before the tree itself.
+        order = []
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            order.append(tree)
+            for subtree in tree.subtrees:
+                if not subtree.is_leaf():
+                    stack.append(subtree)
+        for tree in reversed(order):
+            tree._refresh()
+        return self.weight
+
+    def _refresh(self) -> None:
+        """Recompute the aggregates of this non-leaf tree from those of its
+        subtrees.
+        """
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        for subtree in self.subtrees:
+            self._count += int(subtree._num_leaves())
+            self._sum += subtree._sum_leaves()
+            self._max = max(self._max, subtree._top_weight())
+        self._set_weight()
+
+    def _set_weight(self) -> None:
+        """Set the aggregate weight of this tree from its leaf count and leaf
+        weight sum.
+        """
+        if self._count == 0:
+            self.weight = 0.0
+        elif self.weight_type == 'sum':
+            self.weight = self._sum
         else:
-            if self.weight_type == "sum":
-                self.weight = 0
-                for subtree in self.subtrees:
-                    self.weight += subtree._weighting()
-                return self.weight
+            self.weight = self._sum / self._count
+
+    def _order_weight(self, subtree: SimplePrefixTree) -> None:
+        """Insert <subtree> into self.subtrees at the position its weight
+        sorts to.
+
+        Only the one subtree whose weight changed is moved, instead of sorting
+        the whole list again.
+        """
+        self.subtrees.insert(self._weight_index(subtree.weight), subtree)
+
+    def _take_subtree(self, subtree: SimplePrefixTree) -> None:
+        """Remove <subtree> from self.subtrees before its weight changes.
+
+        Precondition: <subtree> is in self.subtrees.
+        """
+        index = self._weight_index(subtree.weight)
+        while self.subtrees[index] is not subtree:
+            index += 1
+        self.subtrees.pop(index)
+
+    def _weight_index(self, weight: float) -> int:
+        """Return the first index in self.subtrees whose tree weighs at most
+        <weight>.
+        """
+        low, high = 0, len(self.subtrees)
+        while low < high:
+            mid = (low + high) // 2
+            if self.subtrees[mid].weight > weight:
+                low = mid + 1
             else:
-                temp_weight = 0.0
-                for subtree in self.subtrees:
-                    temp_weight += subtree._weighting()
-                    self.weight = temp_weight/self._num_leaves()
-                return temp_weight
-
-    def _order_weight(self) -> None:
-        if not self.is_leaf():
-            if len(self.subtrees) >= 1:
-                lst = [self.subtrees[0]]
-                for subtree in self.subtrees[1:]:
-                    index = subtree._ordering(lst)
-                    lst.insert(index, subtree)
-                self.subtrees = lst
-
-    def _ordering(self, lst: List) -> int:
-        index = 0
-        for item in lst:
-            if self.weight < item.weight:
-                index += 1
-        return index
+                high = mid
+        return low
 
     def _num_leaves(self) -> float:
         if self.is_leaf():
             return 1.0
-        else:
-            counter = 0.0
-            for subtree in self.subtrees:
-                counter += subtree._num_leaves()
-            return counter
+        return float(self._count)
 
     def _sum_leaves(self) -> float:
         if self.is_leaf():
             return self.weight
-        else:
-            counter = 0.0
-            for subtree in self.subtrees:
-                counter += subtree._sum_leaves()
-            return counter
+        return self._sum
 
     def is_empty(self) -> bool:
         """Return whether this simple prefix tree is empty."""
@@ -275,6 +675,19 @@ class SimplePrefixTree(Autocompleter):
         """Return whether this simple prefix tree is a leaf."""
         return self.weight > 0 and self.subtrees == []
 
+    def freeze(self) -> FrozenPrefixTree:
+        """Return a read-only copy of this tree, which answers autocomplete
+        like this tree does but stores its values and structure in flat
+        arrays instead of tree objects.
+
+        >>> tree = SimplePrefixTree('sum')
+        >>> tree.insert('car', 3.0, ['c', 'a', 'r'])
+        >>> tree.insert('cat', 2.0, ['c', 'a', 't'])
+        >>> tree.freeze().autocomplete(['c', 'a'])
+        [('car', 3.0), ('cat', 2.0)]
+        """
+        return FrozenPrefixTree(self)
+
     def __str__(self) -> str:
         """Return a string representation of this tree.
 
@@ -288,13 +701,15 @@ class SimplePrefixTree(Autocompleter):
 
         The indentation level is specified by the <depth> parameter.
         """
-        if self.is_empty():
-            return ''
-        else:
-            s = '  ' * depth + f'{self.value} ({self.weight}) \n'
-            for subtree in self.subtrees:
-                s += subtree._str_indented(depth + 1)
-            return s
+        lines = []
+        stack = [(self, depth)]
+        while stack:
+            tree, level = stack.pop()
+            if not tree.is_empty():
+                lines.append('  ' * level + f'{tree.value} ({tree.weight}) \n')
+                for subtree in reversed(tree.subtrees):
+                    stack.append((subtree, level + 1))
+        return ''.join(lines)
 
     def autocomplete(self, prefix: List,
                      limit: Optional[int] = None) -> List[Tuple[Any, float]]:
@@ -306,115 +721,512 @@ class SimplePrefixTree(Autocompleter):
         If limit is None, return *every* match for the given prefix.
 
         Precondition: limit is None or limit > 0.
+
+        The matching subtree is searched best-first: a heap holds the
+        frontier of unexpanded subtrees, keyed on the largest leaf weight
+        they contain, so leaves come off the heap in non-increasing weight
+        order and the search stops as soon as <limit> values are found.
+        If this tree keeps top-k caches and limit <= k, the matching
+        subtree's cache is sliced instead.
+
+        >>> tree = SimplePrefixTree('sum')
+        >>> tree.insert('car', 3.0, ['c', 'a', 'r'])
+        >>> tree.insert('cat', 2.0, ['c', 'a', 't'])
+        >>> tree.insert('dog', 4.0, ['d', 'o', 'g'])
+        >>> tree.autocomplete([], 1)
+        [('dog', 4.0)]
         """
+        return self._complete(self._locate(prefix), limit)
 
-    #     f
-    #     limit is None and prefix == []:
-    #     lst = []
-    #     for subtree in self.subtrees:
-    #         lst.extend(subtree.autocomplete(prefix, limit))
-    #         lst.sort(key=lambda tup: tup[1], reverse=True)
-    #     return lst
-    #
-    # elif limit is None and prefix != []:
-        if self.is_leaf():
-            return [(self.value, self.weight)]
+    def autocomplete_many(self, queries: Iterable[Tuple[List, Optional[int]]]
+                          ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete(prefix, limit) for each
+        (prefix, limit) pair in <queries>, in the same order.
+
+        The prefixes are located in sorted order, so that prefixes sharing a
+        stem are resolved with a single descent to the deepest tree they
+        share before fanning out.
+
+        Precondition: each limit is None or limit > 0.
+        """
+        queries = [(list(prefix), limit) for prefix, limit in queries]
+        order = sorted(range(len(queries)), key=lambda i: queries[i][0])
+        results = [[] for _ in queries]
+        located = self._locate_sorted([queries[i][0] for i in order])
+        for i, (node, _) in zip(order, located):
+            results[i] = self._complete(node, queries[i][1])
+        return results
+
+    def _complete(self, node: Optional[SimplePrefixTree],
+                  limit: Optional[int]) -> List[Tuple[Any, float]]:
+        """Return up to <limit> values in <node> with their weights, in
+        non-increasing weight order, or [] if <node> is None.
+
+        <node> is this tree or one of its descendants.
+        """
+        if node is None:
+            return []
+        if limit is not None and limit <= self._top_k:
+            return [(leaf.value, leaf.weight) for leaf in node._top[:limit]]
+        return node._best_first(limit)
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield the matches for the given prefix as tuples (value, weight),
+        in non-increasing weight order.
+
+        The matches are found lazily by the same best-first search as
+        autocomplete, so stopping early costs only the matches yielded.
+        This tree must not be changed while the matches are being yielded.
+        """
+        node = self._locate(prefix)
+        if node is not None:
+            yield from node._iter_best_first()
+
+    def _best_first(self, limit: Optional[int]) -> List[Tuple[Any, float]]:
+        """Return up to <limit> values in this tree with their weights, in
+        non-increasing weight order.
+        """
+        return list(itertools.islice(self._iter_best_first(), limit))
+
+    def _iter_best_first(self) -> Iterator[Tuple[Any, float]]:
+        """Yield the values in this tree with their weights, in non-increasing
+        weight order.
+        """
+        return _search(self._frontier(), itertools.count(1))
+
+    def _frontier(self) -> List[Tuple[float, int, SimplePrefixTree]]:
+        """Return the starting frontier of a best-first search of this tree.
+        """
+        if self.is_empty():
+            return []
+        return [(-self._top_weight(), 0, self)]
+
+    def autocomplete_page(self, prefix: List, page_size: int,
+                          cursor: Optional[PageCursor] = None
+                          ) -> Tuple[List[Tuple[Any, float]],
+                                     Optional[PageCursor]]:
+        """Return the next <page_size> matches for the given prefix, and a
+        cursor for the page after them, or None if there are no more matches.
+
+        The matches are ordered as autocomplete would order them. If <cursor>
+        is None the first page is returned; otherwise <cursor> must have been
+        returned by an earlier call for the same prefix.
+
+        The cursor holds the frontier of the best-first search, so each page
+        costs only its own matches, and a cursor can be used more than once.
+
+        Raise ValueError if this tree has changed since <cursor> was
+        returned.
+
+        Precondition: page_size > 0.
+
+        >>> tree = SimplePrefixTree('sum')
+        >>> tree.insert('car', 3.0, ['c', 'a', 'r'])
+        >>> tree.insert('cat', 2.0, ['c', 'a', 't'])
+        >>> tree.insert('dog', 4.0, ['d', 'o', 'g'])
+        >>> page, cursor = tree.autocomplete_page([], 2)
+        >>> page
+        [('dog', 4.0), ('car', 3.0)]
+        >>> tree.autocomplete_page([], 2, cursor)
+        ([('cat', 2.0)], None)
+        """
+        prefix = list(prefix)
+        if cursor is None:
+            node = self._locate(prefix)
+            frontier = [] if node is None else node._frontier()
+            pushed = 1
+        elif cursor._tree is not self or cursor._prefix != prefix:
+            raise ValueError('cursor was returned for a different prefix')
+        elif cursor._version != self._version:
+            raise ValueError('cursor is stale: the tree has changed')
         else:
-            lst = []
-            if limit is None and prefix == []:
-                for subtree in self.subtrees:
-                    lst.extend(subtree.autocomplete(prefix, limit))
-                lst.sort(key=lambda tup: tup[1], reverse=True)
-                return lst
+            frontier = list(cursor._frontier)
+            pushed = cursor._pushed
+
+        counter = itertools.count(pushed)
+        page = list(itertools.islice(_search(frontier, counter), page_size))
+        if not frontier:
+            return page, None
+        return page, PageCursor(self, prefix, frontier, next(counter))
+
+    def _locate(self, prefix: List) -> Optional[SimplePrefixTree]:
+        """Return the smallest subtree that contains every value matching
+        <prefix>, or None if no value in this tree matches <prefix>.
+        """
+        depth = self._root_depth(prefix)
+        if depth is None:
+            return None
+        node = self
+        while node is not None and depth < len(prefix):
+            node, depth = node._step(prefix, depth)
+        return node
+
+    def _root_depth(self, prefix: List) -> Optional[int]:
+        """Return how many elements of <prefix> this tree's value matches, or
+        None if <prefix> and this tree's value diverge.
+        """
+        return len(self.value)
 
-            elif limit is None and prefix != []:
-                for subtree in self.subtrees:
-                    if prefix[0:len(subtree.value)] == subtree.value and \
-                            len(subtree.value) == len(prefix):
-                        lst.extend(subtree.autocomplete([], limit))
-                        lst.sort(key=lambda tup: tup[1], reverse=True)
-                    elif prefix[0:len(subtree.value)] == subtree.value and \
-                            len(subtree.value) != len(prefix):
-                        lst.extend(subtree.autocomplete(prefix, limit))
-                        lst.sort(key=lambda tup: tup[1], reverse=True)
-                return lst
-
-            elif limit is not None and prefix == []:
-                for subtree in self.subtrees:
-                    lst.extend(subtree.autocomplete(prefix, limit))
-                    lst.sort(key=lambda tup: tup[1], reverse=True)
-                    if len(lst) == limit:
-                        return lst
+    def _step(self, prefix: List,
+              depth: int) -> Tuple[Optional[SimplePrefixTree], int]:
+        """Return the subtree of this tree that matches <prefix> one step
+        further than <depth>, together with how many elements of <prefix> it
+        matches, or (None, depth) if there is no such subtree.
 
-                return lst
-            else:
-                for subtree in self.subtrees:
-                    if prefix[0:len(subtree.value)] == subtree.value and \
-                            len(subtree.value) == len(prefix):
-                        lst.extend(subtree.autocomplete([], limit))
-                        lst.sort(key=lambda tup: tup[1], reverse=True)
-                        if len(lst) == limit:
-                            return lst
-
-                    elif prefix[0:len(subtree.value)] == subtree.value and \
-                            len(subtree.value) != len(prefix):
-                        lst.extend(subtree.autocomplete(prefix, limit))
-                        lst.sort(key=lambda tup: tup[1], reverse=True)
-                        if len(lst) == limit:
-                            return lst
-
-                if len(lst) > limit:
-                    lst.__delitem__(len(lst) - 1)
-                return lst
+        Precondition: this tree's value is prefix[:depth]
+        """
+        return self._child(prefix[depth]), depth + 1
+
+    def _locate_sorted(self, prefixes: List[List]
+                       ) -> Iterator[Tuple[Optional[SimplePrefixTree], List]]:
+        """Yield, for each prefix in <prefixes> in turn, the tree _locate
+        would return for it together with the path of trees above that tree.
+
+        Each entry of the path is a tree with the number of prefix elements
+        its value matches. The descent to each prefix continues from the
+        deepest tree on the path it shares with the prefix before it.
+
+        Precondition: <prefixes> is sorted.
+        """
+        path = []
+        last = None
+        for prefix in prefixes:
+            common = 0 if last is None else _common_length(last, prefix, 0)
+            last = prefix
+            while path and path[-1][1] > common:
+                path.pop()
+            if not path:
+                depth = self._root_depth(prefix)
+                if depth is None:
+                    yield None, path
+                    continue
+                if depth == len(prefix):
+                    yield self, path
+                    continue
+                path.append((self, depth))
+            tree, depth = path[-1]
+            while True:
+                tree, depth = tree._step(prefix, depth)
+                if tree is None or depth == len(prefix):
+                    break
+                path.append((tree, depth))
+            yield tree, path
+
+    def _top_weight(self) -> float:
+        """Return the largest weight of a leaf in this tree.
+
+        This is an upper bound on the weight of every value in this tree, for
+        both the 'sum' and the 'average' weight types.
+        """
+        if self.is_leaf():
+            return self.weight
+        return self._max
 
     def remove(self, prefix: List) -> None:
         """Remove all values that match the given prefix.
         """
-        if self.is_leaf():
-            self.value = []
+        self._version += 1
+        tree = self._locate(prefix)
+        if tree is None or tree.is_empty():
+            return
+        if tree is self:
+            self.subtrees = []
+            self._children = None
+            if self._leaves is not None:
+                self._leaves = {}
+            self._shrink_path(self, self._count, self._sum, self._max)
+            return
+
+        if self._leaves is not None:
+            self._forget_leaves(tree)
+        parent = tree._parent
+        parent._take_subtree(tree)
+        parent._unindex_child(tree)
+        tree._parent = None
+        self._shrink_path(parent, tree._count, tree._sum, tree._max)
+
+    def _shrink_path(self, tree: SimplePrefixTree, count: int, total: float,
+                     heaviest: float) -> None:
+        """Update the aggregates of <tree> and of its ancestors up to this tree
+        after <count> leaves, with weights adding up to <total> and at most
+        <heaviest>, were removed from below <tree>.
+
+        Trees left empty are detached from their parents; every other tree on
+        the path is put back in order in its parent's subtrees, and has its
+        top-k cache merged again from its subtrees.
+        """
+        while tree is not None:
+            parent = tree._parent if tree is not self else None
+            tree._shrink(parent, count, total, heaviest)
+            if self._top_k > 0:
+                tree._merge_top(self._top_k)
+            tree = parent
+
+    def remove_many(self, prefixes: Iterable[List]) -> None:
+        """Remove all values that match any of the given prefixes.
+
+        The prefixes are located in sorted order, and prefixes extending an
+        earlier prefix are skipped. Every tree above the removed subtrees then
+        has its aggregates updated once, deepest first.
+        """
+        self._version += 1
+        targets = []
+        # Maps id(tree) to (depth, tree) for every tree on the path to any
+        # removed subtree.
+        above = {}
+        prefixes = sorted(list(prefix) for prefix in prefixes)
+        last = None
+        for prefix, (tree, path) in zip(prefixes,
+                                        self._locate_sorted(prefixes)):
+            if last is not None and prefix[:len(last)] == last:
+                continue
+            last = prefix
+            if tree is self:
+                self.remove(prefix)
+                return
+            if tree is not None and not tree.is_empty():
+                targets.append(tree)
+                for tree, depth in path:
+                    above[id(tree)] = (depth, tree)
+
+        # Maps id(tree) to the leaf count, weight sum and largest leaf weight
+        # removed from below tree.
+        removed = {}
+        for tree in targets:
+            if self._leaves is not None:
+                self._forget_leaves(tree)
+            parent = tree._parent
+            parent._take_subtree(tree)
+            parent._unindex_child(tree)
+            tree._parent = None
+            _add_removed(removed, parent, tree._count, tree._sum, tree._max)
+        for _, tree in sorted(above.values(), key=lambda entry: -entry[0]):
+            count, total, heaviest = removed[id(tree)]
+            parent = tree._parent if tree is not self else None
+            tree._shrink(parent, count, total, heaviest)
+            if self._top_k > 0:
+                tree._merge_top(self._top_k)
+            if parent is not None:
+                _add_removed(removed, parent, count, total, heaviest)
+
+    def _shrink(self, parent: Optional[SimplePrefixTree], count: int,
+                total: float, heaviest: float) -> None:
+        """Update the aggregates of this tree after <count> leaves, with
+        weights adding up to <total> and at most <heaviest>, were removed from
+        below it.
+
+        If this tree is left empty it is detached from <parent>; otherwise it
+        is put back in order in <parent>'s subtrees.
+        """
+        if parent is not None:
+            parent._take_subtree(self)
+        self._count -= count
+        if self._count == 0:
+            self._sum = 0.0
+            self._max = 0.0
             self.weight = 0.0
-        elif prefix == []:
+            if parent is not None:
+                parent._unindex_child(self)
+                self._parent = None
+            elif self._parent is None:
+                self._label = []
+            return
+        self._sum -= total
+        if heaviest >= self._max:
+            self._max = 0.0
             for subtree in self.subtrees:
+                self._max = max(self._max, subtree._top_weight())
+        self._set_weight()
+        self._compress()
+        if parent is not None:
+            parent._order_weight(self)
+
+    def _forget_leaves(self, tree: SimplePrefixTree) -> None:
+        """Drop every leaf of <tree> from this tree's leaf index."""
+        stack = [tree]
+        while stack:
+            tree = stack.pop()
+            for subtree in tree.subtrees:
                 if subtree.is_leaf():
-                    self.weight -= subtree.weight
-                subtree.remove([])
-                subtree._weighting()
-                self._weighting()
-                subtree._clean()
-        else:
-            for subtree in self.subtrees:
-                if prefix[0:len(subtree.value)] == subtree.value:
-                    if subtree.value == prefix and subtree.is_leaf():
-                        self.weight -= subtree.weight
-                        subtree.remove([])
-                        subtree._weighting()
-                        self._weighting()
-                        subtree._clean()
-                    elif subtree.value == prefix:
-                        subtree.remove([])
-                        subtree._weighting()
-                        self._weighting()
-                        subtree._clean()
-                    elif subtree.value != prefix and subtree.is_leaf():
-                        self.weight -= subtree.weight
-                        subtree.remove(prefix)
-                        subtree._weighting()
-                        self._weighting()
-                        subtree._clean()
-                    elif subtree.value != prefix:
-                        subtree.remove(prefix)
-                        subtree._weighting()
-                        self._weighting()
-                        subtree._clean()
-                    if subtree.weight == 0:
-                        self.subtrees.remove(subtree)
-
-    def _clean(self) -> None:
-        for subtree in self.subtrees:
-            if subtree._num_leaves() == 0:
-                self.subtrees.remove(subtree)
-            if subtree.is_empty() and subtree in self.subtrees:
-                self.subtrees.remove(subtree)
+                    self._unindex_leaf(subtree)
+                else:
+                    stack.append(subtree)
+
+    def merge(self, other: SimplePrefixTree) -> None:
+        """Add every value in <other> to this tree with its weight in <other>.
+        A value in both trees ends up with the sum of its two weights.
+
+        The two trees are walked together, so only the trees here that get
+        new values below them are visited. Each of them has its aggregates,
+        subtree order and top-k cache recomputed once at the end, deepest
+        first. A subtree of <other> with no counterpart here is copied over
+        whole. <other> itself is not changed.
+
+        Raise ValueError if <other> is not a prefix tree of the same class and
+        weight type as this tree.
+
+        Preconditions:
+            This tree and <other> are the roots of two different trees.
+            Every value in both trees has the same prefix in each of them.
+
+        >>> tree = SimplePrefixTree.from_items('sum', [
+        ...     ('car', 3.0, ['c', 'a', 'r']),
+        ...     ('cat', 2.0, ['c', 'a', 't'])])
+        >>> other = SimplePrefixTree.from_items('sum', [
+        ...     ('cat', 2.0, ['c', 'a', 't']),
+        ...     ('dog', 1.0, ['d', 'o', 'g'])])
+        >>> tree.merge(other)
+        >>> tree.autocomplete([])
+        [('cat', 4.0), ('car', 3.0), ('dog', 1.0)]
+        """
+        if type(other) is not type(self) or \
+                other.weight_type != self.weight_type:
+            raise ValueError('can only merge a prefix tree of the same class '
+                             'and weight type')
+        self._version += 1
+        if other.is_empty():
+            return
+        if self.is_empty():
+            self._label = list(other._label)
+        common = _common_length(self._label, other._label, 0)
+        if common < len(self._label):
+            self._split_root(common)
+
+        # The non-leaf trees here that get new values below them, other than
+        # copies of trees of <other>, each listed after its parent.
+        order = [self]
+        # Each entry is a tree here that is already in order, a tree of
+        # <other> whose values are still to be added below it, and the part
+        # of the latter's value that extends the former's.
+        stack = [(self, other, other._label[common:])]
+        while stack:
+            tree, source, rest = stack.pop()
+            if not rest:
+                self._add_leaves(tree, source)
+                for subtree in source.subtrees:
+                    if not subtree.is_leaf():
+                        stack.append((tree, subtree, subtree._edge_label()))
+                continue
+            child = tree._child(rest[0])
+            if child is None:
+                self._graft(tree, source, rest)
+                continue
+            common = _common_length(child._edge_label(), rest, 0)
+            if common < len(child._edge_label()):
+                # Only a compressed tree's edges have more than one element.
+                child = child._split_above(common)
+            order.append(child)
+            stack.append((child, source, rest[common:]))
+
+        for tree in reversed(order):
+            tree._refresh()
+            tree.subtrees.sort(key=lambda x: x.weight, reverse=True)
+            if self._top_k > 0:
+                tree._merge_top(self._top_k)
+
+    def _add_leaves(self, tree: SimplePrefixTree,
+                    source: SimplePrefixTree) -> None:
+        """Add the leaves in source.subtrees to tree.subtrees, adding the
+        weight of each one to the leaf with the same value in tree.subtrees
+        if there is one.
+
+        tree.subtrees is left out of order; merge sorts it afterwards.
+        """
+        leaves = {}
+        unhashable = []
+        for subtree in tree.subtrees:
+            if subtree.is_leaf():
+                try:
+                    leaves[subtree.value] = subtree
+                except TypeError:
+                    unhashable.append(subtree)
+        for subtree in source.subtrees:
+            if not subtree.is_leaf():
+                continue
+            try:
+                leaf = leaves.get(subtree.value)
+            except TypeError:
+                leaf = None
+                for other in unhashable:
+                    if other.value == subtree.value:
+                        leaf = other
+                        break
+            if leaf is not None:
+                leaf.weight += subtree.weight
+            else:
+                leaf = type(self)(self.weight_type)
+                leaf.value = subtree.value
+                leaf.weight = subtree.weight
+                leaf._parent = tree
+                tree.subtrees.append(leaf)
+                self._index_leaf(leaf)
+
+    def _graft(self, parent: SimplePrefixTree, source: SimplePrefixTree,
+               rest: List) -> None:
+        """Add a copy of <source>, a non-leaf tree from another prefix tree,
+        to parent.subtrees, where the copy's value extends <parent>'s by
+        <rest>.
+
+        The copied trees take their aggregates from the trees they copy, and
+        only their top-k caches are computed again. parent.subtrees is left
+        out of order.
+        """
+        copy = type(self)(self.weight_type)
+        copy._label = source._label
+        if len(rest) < len(source._edge_label()):
+            # Only a compressed tree's edges are ever entered part way.
+            copy._label = list(rest)
+        copy._parent = parent
+        parent.subtrees.append(copy)
+        parent._index_child(copy)
+        copies = []
+        stack = [(copy, source)]
+        while stack:
+            tree, source = stack.pop()
+            copies.append(tree)
+            tree._count = source._count
+            tree._sum = source._sum
+            tree._max = source._max
+            tree.weight = source.weight
+            for subtree in source.subtrees:
+                child = type(self)(self.weight_type)
+                child._label = subtree._label
+                child._parent = tree
+                tree.subtrees.append(child)
+                if subtree.is_leaf():
+                    child.weight = subtree.weight
+                    self._index_leaf(child)
+                else:
+                    tree._index_child(child)
+                    stack.append((child, subtree))
+        if self._top_k > 0:
+            for tree in reversed(copies):
+                tree._merge_top(self._top_k)
+
+    def _index_leaf(self, leaf: SimplePrefixTree) -> None:
+        """Add <leaf> to this tree's leaf index, if it has one."""
+        if self._leaves is not None:
+            try:
+                self._leaves[leaf.value] = leaf
+            except TypeError:
+                pass
+
+    def _unindex_leaf(self, leaf: SimplePrefixTree) -> None:
+        """Drop <leaf> from this tree's leaf index, if it has one and <leaf>
+        is in it.
+        """
+        if self._leaves is not None:
+            try:
+                if self._leaves.get(leaf.value) is leaf:
+                    del self._leaves[leaf.value]
+            except TypeError:
+                pass
+
+    def _compress(self) -> None:
+        """Merge this tree with its only subtree if that makes it compressible.
+
+        Simple prefix trees are never compressed.
+        """
 
 
 ###############################################################################
@@ -442,6 +1254,14 @@ class CompressedPrefixTree(SimplePrefixTree):
     weight_type:
         The way the aggregate weight of the values in a tree is calculated
 
+    === Private Attributes ===
+    As for SimplePrefixTree, except that:
+    _label:
+        For a non-leaf tree with a parent, the list of elements that its
+        value adds to its parent's value (its edge label).
+    _children:
+        The non-leaf trees in self.subtrees, keyed by the first element of
+        their _label, or None if it has not been built.
 
     === Representation invariants ===
     - self.weight >= 0
@@ -467,294 +1287,240 @@ class CompressedPrefixTree(SimplePrefixTree):
       both can appear in the same self.subtrees list, and both have a `weight`
       attribute.
     """
-    value: Optional[Any]
     weight: float
     subtrees: List[CompressedPrefixTree]
     weight_type: str
-
-    def __init__(self, weight_type: str) -> None:
-        self.value = []
-        self.weight = 0.0
-        self.subtrees = []
-        self.weight_type = weight_type
-
-    def insert(self, value: Any, weight: float, prefix: List) -> None:
-        """Insert the given value into this Autocompleter.
-
-        The value is inserted with the given weight, and is associated with
-        the prefix sequence <prefix>.
-
-        If the value has already been inserted into this prefix tree
-        (compare values using ==), then the given weight should be *added* to
-        the existing weight of this value.
-
-        Preconditions:
-        weight > 0
-        The given value is either:
-        1) not in this Autocompleter
-        2) was previously inserted with the SAME prefix sequence
+    _label: Any
+    _parent: Optional[CompressedPrefixTree]
+    _children: Optional[Dict[Any, CompressedPrefixTree]]
+    __slots__ = ()
+
+    @property
+    def value(self) -> Any:
+        """The value stored at the root of this prefix tree.
+
+        An internal tree stores only the elements its prefix adds to its
+        parent's (the edge label), so its value is rebuilt from the labels
+        on the path from the root.
         """
-        new = CompressedPrefixTree(self.weight_type)
-
-        if self.value == [] and len(self.subtrees) == 0:
-            self.value = prefix
-            new.value = value
-            new.weight = weight
-            self.subtrees.append(new)
-            if self.weight_type == 'sum':
-                self._summing()
-            elif self.weight_type == 'average':
-                self._aver()
-        else:
-            if prefix == self.value and not self.is_leaf():
-                new.value = value
-                new.weight = weight
-                self.subtrees.append(new)
-            else:
-                if self.is_leaf() and self.value == value:
-                    self.weight += weight
-                elif self.value == prefix:
-                    new.value = value
-                    new.weight = weight
-                    self.subtrees.append(new)
-
-                else:
-                    common = []
-                    for subtree in self.subtrees:
-                        common.append(len(subtree._longest_common(prefix)))
-                    self._insertion(common, value, weight, prefix)
-
-    def _insertion(self, common: List, value: Any, weight: float, prefix: List)\
-            -> None:
-        new = CompressedPrefixTree(self.weight_type)
-        if sum(common) == 0:
-            new_parent = CompressedPrefixTree(self.weight_type)
-            new_parent.value = self.value
-            new_parent.subtrees, self.value = self.subtrees, []
-            self.subtrees = []
-            self.weight = 0.0
-            self.subtrees.append(new_parent)
-            new_insert = CompressedPrefixTree(self.weight_type)
-            new_insert.value = prefix
-            new.value = value
-            new.weight = weight
-            new_insert.subtrees.append(new)
-            self.subtrees.append(new_insert)
-            if self.weight_type == 'sum':
-                new_insert._summing()
-                new_parent._summing()
-                self._summing()
-            elif self.weight_type == 'average':
-                new_insert._aver()
-                new_parent._aver()
-                self._aver()
-
-        else:
-            large = max(common)
-            if large == 0:
-                new.value = prefix
-                obj = CompressedPrefixTree(self.weight_type)
-                obj.value = value
-                obj.weight = weight
-                new.subtrees.append(obj)
-                self.subtrees.append(new)
-            else:
-                self._second(common, value, weight, prefix)
-
-    def _second(self, common: List, value: Any, weight: float, prefix: List)\
-            -> None:
-        large = max(common)
-        new = CompressedPrefixTree(self.weight_type)
-        subtree = self.subtrees[common.index(large)]
-        if len(subtree.value) == large and not \
-                subtree.is_leaf():
-            subtree.insert(value, weight, prefix)
-        elif len(subtree.value) == large and \
-                subtree.is_leaf():
-            new.value = prefix
-            new_child = CompressedPrefixTree(
-                self.weight_type)
-            new_child.value, new_child.weight = value, weight
-            new.subtrees.append(new_child)
-            self.subtrees.append(new)
-            if self.weight_type == 'sum':
-                new_child._summing()
-                new._summing()
-                self._summing()
-            elif self.weight_type == 'average':
-                new_child._aver()
-                new._aver()
-                self._aver()
-
-        elif not subtree.is_leaf():
-            first_prefix = []
-            for i in range(large):
-                first_prefix.append(subtree.value[i])
-
-            new_parent = CompressedPrefixTree(
-                self.weight_type)
-            new_parent.value, subtree.value = subtree.value, first_prefix
-            new_parent.subtrees.extend(subtree.subtrees)
-            subtree.subtrees = [new_parent]
-            insert_parent = CompressedPrefixTree(
-                self.weight_type)
-            insert_parent.value = prefix
-            insert_child = CompressedPrefixTree(
-                self.weight_type)
-            insert_child.value = value
-            insert_child.weight = weight
-            insert_parent.subtrees.append(insert_child)
-            subtree.subtrees.append(insert_parent)
-            if self.weight_type == 'sum':
-                insert_parent._summing()
-                new_parent._summing()
-                subtree._summing()
-                self._summing()
-            elif self.weight_type == 'average':
-                insert_parent._aver()
-                new_parent._aver()
-                subtree._aver()
-                self._aver()
-            self.subtrees.sort(key=lambda x: x.weight,
-                               reverse=True)
-            subtree.subtrees.sort(key=lambda x: x.weight,
-                                  reverse=True)
-            insert_parent.subtrees.sort(key=lambda
-                x: x.weight, reverse=True)
-            new_parent.subtrees.sort(key=lambda
-                x: x.weight, reverse=True)
-
-        elif subtree.is_leaf():
-            self._leafy(common, value, weight, prefix)
-
-    def _leafy(self, common: List, value: Any, weight: float, prefix: List)\
-            -> None:
-        large = max(common)
-        subtree = self.subtrees[common.index(large)]
-        first_prefix = []
-        for i in range(large):
-            first_prefix.append(subtree.value[i])
-        new_parent = CompressedPrefixTree(
-            self.weight_type)
-        new_parent.value = self.value
-        self.value = first_prefix
-        new_parent.subtrees.extend(self.subtrees)
-        self.subtrees = [new_parent]
-        insert_parent = CompressedPrefixTree(
-            self.weight_type)
-        insert_parent.value = prefix
-        insert_child = CompressedPrefixTree(
-            self.weight_type)
-        insert_child.value = value
-        insert_child.weight = weight
-        insert_parent.subtrees.append(insert_child)
-        self.subtrees.append(insert_parent)
-        if self.weight_type == 'sum':
-            insert_parent._summing()
-            new_parent._summing()
-            subtree._summing()
-            self._summing()
-        elif self.weight_type == 'average':
-            insert_parent._aver()
-            new_parent._aver()
-            subtree._aver()
-            self._aver()
-        self.subtrees.sort(key=lambda x: x.weight,
-                           reverse=True)
-        subtree.subtrees.sort(key=lambda x: x.weight,
-                              reverse=True)
-        insert_parent.subtrees.sort(key=lambda
-            x: x.weight, reverse=True)
-        new_parent.subtrees.sort(key=lambda
-            x: x.weight, reverse=True)
-
-    def autocomplete(self, prefix: List,
-                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
-        """Return up to <limit> matches for the given prefix.
-
-        The return value is a list of tuples (value, weight), and must be
-        ordered in non-increasing weight. (You can decide how to break ties.)
-
-        If limit is None, return *every* match for the given prefix.
-
-        Precondition: limit is None or limit > 0.
+        if self._parent is None or self.is_leaf():
+            return self._label
+        labels = []
+        tree = self
+        while tree._parent is not None:
+            labels.append(tree._label)
+            tree = tree._parent
+        value = list(tree._label)
+        for label in reversed(labels):
+            value.extend(label)
+        return value
+
+    @value.setter
+    def value(self, value: Any) -> None:
+        self._label = value
+
+    def _edge_label(self) -> List:
+        return self._label
+
+    def _edge_key(self) -> Any:
+        return self._label[0]
+
+    def _insertion_point(self, prefix: List) -> CompressedPrefixTree:
+        """Return the tree whose value is <prefix>, splitting at most one edge
+        and creating at most one new tree on the way down to it.
         """
-        if self.is_leaf():
-            return [(self.value, self.weight)]
+        if self.is_empty():
+            self._label = list(prefix)
+            return self
+        depth = _common_length(self._label, prefix, 0)
+        if depth < len(self._label):
+            self._split_root(depth)
+        tree = self
+        while depth < len(prefix):
+            subtree = tree._child(prefix[depth])
+            if subtree is None:
+                subtree = CompressedPrefixTree(self.weight_type)
+                subtree._label = list(prefix[depth:])
+                subtree._parent = tree
+                tree._order_weight(subtree)
+                tree._index_child(subtree)
+                return subtree
+            common = _common_length(subtree._label, prefix, depth)
+            if common < len(subtree._label):
+                subtree = tree._split(subtree, common)
+            tree = subtree
+            depth += common
+        return tree
+
+    def _split(self, subtree: CompressedPrefixTree,
+               length: int) -> CompressedPrefixTree:
+        """Split the edge from this tree to the non-leaf <subtree> after its
+        first <length> elements, and return the new tree in the middle.
+
+        Precondition: 0 < length < len(subtree._label)
+        """
+        middle = CompressedPrefixTree(self.weight_type)
+        middle._label = subtree._label[:length]
+        middle._parent = self
+        middle._copy_aggregates(subtree)
+        self._take_subtree(subtree)
+        subtree._label = subtree._label[length:]
+        subtree._parent = middle
+        middle.subtrees = [subtree]
+        self._order_weight(middle)
+        # middle has the same _edge_key as <subtree>, which it replaces.
+        self._index_child(middle)
+        return middle
+
+    def _split_root(self, length: int) -> None:
+        """Move everything below this root into a new subtree whose label is
+        the part of this root's label after its first <length> elements.
+
+        Precondition: 0 <= length < len(self._label)
+        """
+        subtree = CompressedPrefixTree(self.weight_type)
+        subtree._label = self._label[length:]
+        subtree._parent = self
+        subtree._copy_aggregates(self)
+        subtree.subtrees = self.subtrees
+        subtree._children = self._children
+        for child in subtree.subtrees:
+            child._parent = subtree
+        self._label = self._label[:length]
+        self.subtrees = [subtree]
+        self._children = None
+
+    def _split_above(self, length: int) -> CompressedPrefixTree:
+        """Split the edge from this non-leaf tree's parent to this tree after
+        its first <length> elements, and return the new tree in the middle.
+
+        The new tree takes this tree's place in its parent's subtrees, and
+        its aggregates are left for merge to compute.
+
+        Precondition: 0 < length < len(self._label)
+        """
+        parent = self._parent
+        middle = CompressedPrefixTree(self.weight_type)
+        middle._label = self._label[:length]
+        middle._parent = parent
+        parent.subtrees[parent.subtrees.index(self)] = middle
+        parent._index_child(middle)
+        self._label = self._label[length:]
+        self._parent = middle
+        middle.subtrees = [self]
+        return middle
+
+    def _copy_aggregates(self, other: CompressedPrefixTree) -> None:
+        """Give this tree the same aggregates as <other>."""
+        self._count = other._count
+        self._sum = other._sum
+        self._max = other._max
+        self.weight = other.weight
+        self._top = other._top[:]
+
+    def _root_depth(self, prefix: List) -> Optional[int]:
+        common = _common_length(self._label, prefix, 0)
+        if common < len(self._label) and common < len(prefix):
+            return None
+        return common
+
+    def _step(self, prefix: List,
+              depth: int) -> Tuple[Optional[CompressedPrefixTree], int]:
+        """Return the subtree of this tree that matches <prefix> further than
+        <depth>, together with how many elements of <prefix> it matches, or
+        (None, depth) if there is no such subtree.
+
+        The returned subtree's value may extend past the end of <prefix>.
+
+        Precondition: this tree's value is prefix[:depth]
+        """
+        subtree = self._child(prefix[depth])
+        if subtree is None:
+            return None, depth
+        common = _common_length(subtree._label, prefix, depth)
+        if common < len(subtree._label) and depth + common < len(prefix):
+            return None, depth
+        return subtree, depth + common
+
+    def _open(self, prefix: List, depth: int) -> CompressedPrefixTree:
+        """Return a new, empty subtree of this tree whose value is <prefix>,
+        without adding it to self.subtrees yet.
+
+        Precondition: self.value == prefix[:depth]
+        """
+        subtree = CompressedPrefixTree(self.weight_type)
+        subtree._label = list(prefix[depth:])
+        subtree._parent = self
+        return subtree
+
+    def _finish(self) -> None:
+        self._compress()
+        super()._finish()
+
+    def _compress(self) -> None:
+        """Merge this tree with its only subtree if that subtree is not a
+        leaf, which would make this tree's value compressible.
+        """
+        if len(self.subtrees) == 1 and not self.subtrees[0].is_leaf():
+            subtree = self.subtrees[0]
+            self._label = self._label + subtree._label
+            self.subtrees = subtree.subtrees
+            self._children = subtree._children
+            for child in self.subtrees:
+                child._parent = self
+
+
+def _search(frontier: List[Tuple[float, int, SimplePrefixTree]],
+            counter: Iterator[int]) -> Iterator[Tuple[Any, float]]:
+    """Yield the values in the subtrees on <frontier> with their weights, in
+    non-increasing weight order, by a best-first search.
+
+    <frontier> is a heap of (-largest leaf weight, -count, subtree) entries,
+    which is updated in place as the search goes on; <counter> gives the
+    count for each subtree pushed onto it.
+    """
+    # Ties are broken in favour of the most recently pushed tree, so that
+    # equally weighted subtrees are explored depth-first.
+    while frontier:
+        tree = heapq.heappop(frontier)[2]
+        if tree.is_leaf():
+            yield tree.value, tree.weight
         else:
-            if limit is None:
-                lst = []
-                if prefix == []:
-                    for subtree in self.subtrees:
-                        lst.extend(subtree.autocomplete(prefix, limit))
-                        lst.sort(key=lambda tup: tup[1], reverse=True)
-                    return lst
-                else:
-                    for subtree in self.subtrees:
-                        if prefix[0:len(subtree.value)] == subtree.value:
-                            if len(subtree.value) == len(prefix):
-                                lst.extend(subtree.autocomplete([], limit))
-                                lst.sort(key=lambda tup: tup[1], reverse=True)
-                            else:
-                                lst.extend(subtree.autocomplete(prefix, limit))
-                                lst.sort(key=lambda tup: tup[1], reverse=True)
-                    return lst
-            else:
-                lst = []
-                if prefix == []:
-                    for subtree in self.subtrees:
-                        lst.extend(subtree.autocomplete(prefix, limit))
-                        lst.sort(key=lambda tup: tup[1], reverse=True)
-                        if len(lst) == limit:
-                            return lst
-                    return lst
-                else:
-                    for subtree in self.subtrees:
-                        if prefix[0:len(subtree.value)] == subtree.value:
-                            if len(subtree.value) == len(prefix):
-                                lst.extend(subtree.autocomplete([], limit))
-                                lst.sort(key=lambda tup: tup[1], reverse=True)
-                                if len(lst) == limit:
-                                    return lst
-                            else:
-                                lst.extend(subtree.autocomplete(prefix, limit))
-                                lst.sort(key=lambda tup: tup[1], reverse=True)
-                                if len(lst) == limit:
-                                    return lst
-                    return lst
-
-    def _summing(self) -> float:
-        if not self.is_leaf():
-            self.weight = 0.0
-            for subtree in self.subtrees:
-                self.weight += subtree.weight
-        return self.weight
+            for subtree in reversed(tree.subtrees):
+                heapq.heappush(frontier,
+                               (-subtree._top_weight(), -next(counter),
+                                subtree))
 
-    def _aver(self) -> None:
-        if not self.is_leaf():
-            self.weight = 0.0
-            sums = self._summing()
-            leaves = self._num_leaves()
-            self.weight = sums / leaves
-
-    def _longest_common(self, other: str) -> List[Any]:
-        counter = 0
-        result = []
-        if isinstance(other, str):
-            oth = list(other)
-        else:
-            oth = other
-        while counter < len(self.value) and counter < len(oth):
-            if self.value[counter] == oth[counter]:
-                result.append(self.value[counter])
-                counter += 1
-            else:
-                break
-        return result
+
+def _common_length(label: List, prefix: List, start: int) -> int:
+    """Return the length of the longest common prefix of <label> and
+    prefix[start:].
+    """
+    length = 0
+    limit = min(len(label), len(prefix) - start)
+    while length < limit and label[length] == prefix[start + length]:
+        length += 1
+    return length
+
+
+def _add_removed(removed: Dict[int, Tuple[int, float, float]],
+                 tree: SimplePrefixTree, count: int, total: float,
+                 heaviest: float) -> None:
+    """Record in <removed> that <count> leaves, with weights adding up to
+    <total> and at most <heaviest>, were removed from below <tree>.
+    """
+    if id(tree) in removed:
+        old_count, old_total, old_heaviest = removed[id(tree)]
+        removed[id(tree)] = (old_count + count, old_total + total,
+                             max(old_heaviest, heaviest))
+    else:
+        removed[id(tree)] = (count, total, heaviest)
 
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'max-nested-blocks': 4
+        'max-nested-blocks': 4,
+        'extra-imports': ['heapq', 'itertools', 'array', 'autocompleter',
+                          'frozen_prefix_tree']
     })
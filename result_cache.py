@@ -0,0 +1,148 @@
+"""CSC148 Assignment 2: Autocomplete result cache
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module description ===
+This file contains a bounded least-recently-used cache of autocomplete
+results, which the autocomplete engines can put in front of their
+Autocompleter.
+
+Entries are keyed on a prefix sequence and a limit. Rather than being flushed
+whenever the Autocompleter changes, each entry is dropped only when a change
+could affect the values that match its prefix.
+"""
+from __future__ import annotations
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class ResultCache:
+    """A bounded LRU cache of autocomplete results.
+
+    === Attributes ===
+    size: the largest number of results kept, or 0 if nothing is cached.
+    ttl: how many seconds a result is kept for, or None if results do not
+        expire.
+    hits: the number of lookups answered from this cache.
+    misses: the number of lookups that had to compute their result.
+    evictions: the number of results dropped because this cache was full or
+        because they expired.
+
+    === Private Attributes ===
+    _entries:
+        Maps each (prefix, limit) key to the time its result was computed
+        and the result, from least to most recently used.
+    _limits:
+        Maps each prefix in _entries to the limits it is cached with, so that
+        the entries for one prefix are found without a scan.
+
+    === Representation invariants ===
+    - len(self._entries) <= self.size
+    - (prefix, limit) is a key of self._entries if and only if
+      limit in self._limits[prefix].
+    """
+    size: int
+    ttl: Optional[float]
+    hits: int
+    misses: int
+    evictions: int
+    _entries: OrderedDict
+    _limits: Dict[Tuple, Set[Optional[int]]]
+
+    def __init__(self, size: int, ttl: Optional[float] = None) -> None:
+        """Initialize an empty cache holding at most <size> results, each for
+        at most <ttl> seconds.
+
+        Precondition: size >= 0 and (ttl is None or ttl > 0).
+        """
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._limits = {}
+
+    def lookup(self, prefix: List, limit: Optional[int],
+               compute: Callable[[List, Optional[int]],
+                                 List[Tuple[Any, float]]]
+               ) -> List[Tuple[Any, float]]:
+        """Return the cached result for <prefix> and <limit>, or compute it
+        with compute(prefix, limit) and cache it.
+        """
+        if self.size == 0:
+            return compute(prefix, limit)
+        key = (tuple(prefix), limit)
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl is not None and \
+                time.monotonic() - entry[0] > self.ttl:
+            self._drop(key)
+            self.evictions += 1
+            entry = None
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return list(entry[1])
+
+        self.misses += 1
+        result = compute(prefix, limit)
+        self._entries[key] = (time.monotonic(), list(result))
+        self._limits.setdefault(key[0], set()).add(limit)
+        if len(self._entries) > self.size:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+        return result
+
+    def inserted(self, prefix: List) -> None:
+        """Drop the results that a value inserted with <prefix> could change:
+        those for every prefix of <prefix>.
+        """
+        for length in range(len(prefix) + 1):
+            self._drop_prefix(tuple(prefix[:length]))
+
+    def removed(self, prefixes: Iterable[List]) -> None:
+        """Drop the results that removing the values matching any of
+        <prefixes> could change: those for every prefix of one of <prefixes>,
+        and those for every prefix that one of <prefixes> is a prefix of.
+        """
+        removed = set()
+        for prefix in prefixes:
+            removed.add(tuple(prefix))
+            self.inserted(prefix)
+        if not removed or not self._limits:
+            return
+        for cached in list(self._limits):
+            for length in range(len(cached) + 1):
+                if cached[:length] in removed:
+                    self._drop_prefix(cached)
+                    break
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit, miss and eviction counts of this cache, and the
+        number of results it currently holds.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._entries)}
+
+    def _drop(self, key: Tuple[Tuple, Optional[int]]) -> None:
+        """Remove the entry for <key> from this cache."""
+        del self._entries[key]
+        limits = self._limits[key[0]]
+        limits.discard(key[1])
+        if not limits:
+            del self._limits[key[0]]
+
+    def _drop_prefix(self, prefix: Tuple) -> None:
+        """Remove every entry for <prefix> from this cache."""
+        for limit in self._limits.pop(prefix, ()):
+            del self._entries[(prefix, limit)]
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['time', 'collections']
+    })
@@ -17,8 +17,21 @@ please see
 Note: this file is for support purposes only, and is not part of your
 submission.
 """
+import csv
+import gzip
+import os
+import pickle
+import tempfile
+import time
+
+import pytest
+
 from prefix_tree import SimplePrefixTree, CompressedPrefixTree
-from autocomplete_engines import SentenceAutocompleteEngine
+from frozen_prefix_tree import FrozenPrefixTree
+from autocomplete_engines import LetterAutocompleteEngine, \
+    SentenceAutocompleteEngine
+from result_cache import ResultCache
+from chunked_reader import iter_blocks, iter_lines
 
 
 def test_simple_prefix_tree_structure() -> None:
@@ -68,10 +81,64 @@ def test_simple_prefix_tree_autocomplete() -> None:
     # SimplePrefixTree.autocomplete.
     assert t.autocomplete([]) == [('dog', 4.0), ('car', 3.0), ('cat', 2.0)]
 
-    # But keep in mind that the greedy algorithm here does not necessarily
-    # return the highest-weight values!! In this case, the ['c'] subtree
-    # is recursed on first.
-    assert t.autocomplete([], 1) == [('car', 3.0)]
+    # The search is best-first, so a limited autocomplete returns the
+    # highest-weight values even though the ['c'] subtree has the larger
+    # aggregate weight.
+    assert t.autocomplete([], 1) == [('dog', 4.0)]
+    assert t.autocomplete([], 2) == [('dog', 4.0), ('car', 3.0)]
+    assert t.autocomplete(['c'], 1) == [('car', 3.0)]
+
+
+def test_simple_prefix_tree_iter_autocomplete() -> None:
+    """Matches can also be consumed lazily, one at a time, in the order
+    autocomplete gives them.
+    """
+    t = SimplePrefixTree('sum')
+    t.insert('car', 3.0, ['c', 'a', 'r'])
+    t.insert('cat', 2.0, ['c', 'a', 't'])
+    t.insert('dog', 4.0, ['d', 'o', 'g'])
+
+    matches = t.iter_autocomplete([])
+    assert next(matches) == ('dog', 4.0)
+    assert list(matches) == [('car', 3.0), ('cat', 2.0)]
+
+
+def test_simple_prefix_tree_autocomplete_many() -> None:
+    """A batch of queries gets its results back in the order it was given.
+    """
+    t = SimplePrefixTree('sum')
+    t.insert('car', 3.0, ['c', 'a', 'r'])
+    t.insert('cat', 2.0, ['c', 'a', 't'])
+    t.insert('dog', 4.0, ['d', 'o', 'g'])
+
+    assert t.autocomplete_many([(['c', 'a'], None), (['x'], 1), ([], 1)]) == \
+        [[('car', 3.0), ('cat', 2.0)], [], [('dog', 4.0)]]
+
+
+def test_simple_prefix_tree_autocomplete_page() -> None:
+    """Pages of matches come in the order autocomplete gives them, and a
+    cursor only works for its own prefix and only until the tree changes.
+    """
+    t = SimplePrefixTree('sum')
+    t.insert('car', 3.0, ['c', 'a', 'r'])
+    t.insert('cat', 2.0, ['c', 'a', 't'])
+    t.insert('dog', 4.0, ['d', 'o', 'g'])
+
+    # Pages pick up where the previous page left off.
+    page, cursor = t.autocomplete_page([], 2)
+    assert page == [('dog', 4.0), ('car', 3.0)]
+    assert t.autocomplete_page([], 2, cursor) == ([('cat', 2.0)], None)
+
+    _, cursor = t.autocomplete_page([], 1)
+    with pytest.raises(ValueError):
+        t.autocomplete_page(['c'], 1, cursor)
+    t.insert('cow', 1.0, ['c', 'o', 'w'])
+    with pytest.raises(ValueError):
+        t.autocomplete_page([], 1, cursor)
+    _, cursor = t.autocomplete_page([], 1)
+    t.remove(['c', 'o'])
+    with pytest.raises(ValueError):
+        t.autocomplete_page([], 1, cursor)
 
 
 def test_simple_prefix_tree_remove() -> None:
@@ -98,6 +165,115 @@ def test_simple_prefix_tree_remove() -> None:
     assert t.subtrees[0].value == ['d']
 
 
+def test_simple_prefix_tree_remove_many() -> None:
+    """Removing several prefixes at once, including overlapping ones, leaves
+    the same tree as removing them one at a time.
+    """
+    t = SimplePrefixTree('sum')
+    t.insert('dog', 4.0, ['d', 'o', 'g'])
+    t.insert('cat', 2.0, ['c', 'a', 't'])
+    t.insert('car', 3.0, ['c', 'a', 'r'])
+    t.insert('cow', 1.0, ['c', 'o', 'w'])
+    t.remove_many([['c', 'a', 'r'], ['e'], ['c', 'a'], ['c', 'o']])
+
+    assert len(t) == 1
+    assert t.weight == 4.0
+    assert len(t.subtrees) == 1
+    assert t.subtrees[0].value == ['d']
+
+
+def test_simple_prefix_tree_many_subtrees() -> None:
+    """A tree with too many subtrees to scan finds, adds and removes its
+    subtrees correctly, before and after it indexes them.
+    """
+    t = SimplePrefixTree('sum')
+    for i in range(20):
+        t.insert(i, i + 1.0, [i, 'x'])
+    assert t.autocomplete([19]) == [(19, 20.0)]
+
+    t.remove([5])
+    t.insert(25, 1.0, [25, 'y'])
+    t.insert(3, 1.0, [3, 'x'])
+    assert t.autocomplete([5]) == []
+    assert t.autocomplete([25]) == [(25, 1.0)]
+    assert t.autocomplete([3]) == [(3, 5.0)]
+    assert len(t) == 20
+
+
+def test_simple_prefix_tree_top_k() -> None:
+    """A tree keeping top-k caches gives the same limited results as one that
+    does not, across inserts and removes.
+    """
+    t = SimplePrefixTree('sum', top_k=2)
+    t.insert('car', 3.0, ['c', 'a', 'r'])
+    t.insert('cat', 2.0, ['c', 'a', 't'])
+    t.insert('dog', 4.0, ['d', 'o', 'g'])
+    t.insert('cat', 2.5, ['c', 'a', 't'])
+    assert t.autocomplete([], 2) == [('cat', 4.5), ('dog', 4.0)]
+    assert t.autocomplete(['c'], 1) == [('cat', 4.5)]
+
+    t.remove(['c', 'a', 't'])
+    assert t.autocomplete([], 2) == [('dog', 4.0), ('car', 3.0)]
+    assert t.autocomplete([], 3) == [('dog', 4.0), ('car', 3.0)]
+
+
+def test_simple_prefix_tree_from_items() -> None:
+    """Bulk-loading a simple prefix tree gives the same tree as inserting the
+    values one at a time, including the summed weight of a repeated value.
+    """
+    t = SimplePrefixTree.from_items('sum', [
+        ('cat', 2.0, ['c', 'a', 't']),
+        ('dog', 4.0, ['d', 'o', 'g']),
+        ('car', 3.0, ['c', 'a', 'r']),
+        ('cat', 1.5, ['c', 'a', 't'])
+    ])
+
+    assert len(t) == 3
+    assert t.weight == 2.0 + 4.0 + 3.0 + 1.5
+    assert [subtree.value for subtree in t.subtrees] == [['c'], ['d']]
+    assert t.autocomplete(['c', 'a']) == [('cat', 3.5), ('car', 3.0)]
+
+    # Later inserts still find the bulk-loaded values.
+    t.insert('dog', 1.0, ['d', 'o', 'g'])
+    assert t.autocomplete([], 1) == [('dog', 5.0)]
+
+
+def test_prefix_tree_pickle() -> None:
+    """Pickling a prefix tree works however deep the tree is, and gives back
+    an equivalent tree.
+    """
+    t = SimplePrefixTree('sum')
+    t.insert('deep', 1.0, ['x'] * 5000)
+    t.insert('car', 3.0, ['c', 'a', 'r'])
+    t.insert('cat', 2.0, ['c', 'a', 't'])
+    copy = pickle.loads(pickle.dumps(t))
+
+    assert len(copy) == 3
+    assert copy.weight == 6.0
+    assert copy.autocomplete(['c']) == [('car', 3.0), ('cat', 2.0)]
+    assert copy.autocomplete(['x'] * 10) == [('deep', 1.0)]
+
+
+def test_prefix_tree_merge() -> None:
+    """Merging sums the weights of shared values, splits compressed edges
+    where the trees part, and leaves the other tree unchanged.
+    """
+    for cls in [SimplePrefixTree, CompressedPrefixTree]:
+        t = cls.from_items('sum', [('car', 3.0, ['c', 'a', 'r']),
+                                   ('cart', 1.0, ['c', 'a', 'r', 't'])], 2)
+        other = cls.from_items('sum', [('car', 2.0, ['c', 'a', 'r']),
+                                       ('cat', 4.0, ['c', 'a', 't'])])
+        t.merge(other)
+
+        assert len(t) == 3
+        assert t.weight == 10.0
+        assert t.autocomplete(['c', 'a']) == [('car', 5.0), ('cat', 4.0),
+                                              ('cart', 1.0)]
+        assert t.autocomplete(['c', 'a'], 2) == [('car', 5.0), ('cat', 4.0)]
+        assert len(other) == 2
+        assert other.autocomplete(['c']) == [('cat', 4.0), ('car', 2.0)]
+
+
 def test_sentence_autocompleter() -> None:
     """Basic test for SentenceAutocompleteEngine.
 
@@ -136,7 +312,232 @@ def test_sentence_autocompleter() -> None:
     assert results[0][0] == 'a star is born'
     assert results[0][1] == 15.0 + 6.5
 
+
+def test_letter_autocompleter_sanitization() -> None:
+    """Lines are sanitized, and lines left without an alphanumeric character
+    are skipped.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'lines.txt')
+        with open(path, 'w') as f:
+            f.write('Hello, World!\n   \n!?!\nhello world\n\t\nR2-D2\n')
+        engine = LetterAutocompleteEngine({
+            'file': path,
+            'autocompleter': 'simple',
+            'weight_type': 'sum'
+        })
+        assert len(engine.autocompleter) == 2
+        assert engine.autocomplete('') == [('hello world', 2), ('r2d2', 1)]
+        assert engine.autocomplete(' ') == []
+
+
+def test_sentence_autocompleter_empty_prefix() -> None:
+    """An empty prefix, or one with only whitespace, matches every sentence.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sentences.csv')
+        with open(path, 'w') as f:
+            f.write('How to cook?,3\nwhat  is   LOVE ,1\n!!!,5\n')
+        engine = SentenceAutocompleteEngine({
+            'file': path,
+            'autocompleter': 'simple',
+            'weight_type': 'sum'
+        })
+        expected = [('how to cook', 3.0), ('what is love', 1.0)]
+        assert engine.autocomplete('') == expected
+        assert engine.autocomplete('  ') == expected
+        assert engine.autocomplete('what is ') == [('what is love', 1.0)]
+
+
+def test_sentence_autocompleter_workers() -> None:
+    """Reading the file with several processes gives the same engine, even
+    when copies of a sentence are read by different processes.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sentences.csv')
+        with open(path, 'w') as f:
+            f.write('A star is born!,15\n')
+            for i in range(200):
+                f.write('sentence number {},{}\n'.format(i % 50, i))
+            f.write('a STAR is born,6.5\n')
+        config = {
+            'file': path,
+            'autocompleter': 'compressed',
+            'weight_type': 'sum'
+        }
+        expected = SentenceAutocompleteEngine(config).autocomplete('')
+        config['workers'] = 3
+        engine = SentenceAutocompleteEngine(config)
+        assert sorted(engine.autocomplete('')) == sorted(expected)
+        assert len(engine.autocompleter) == 51
+        assert engine.autocomplete('a') == [('a star is born', 15.0 + 6.5)]
+        assert engine.autocomplete('sentence number 7') == \
+            [('sentence number 7', 7.0 + 57 + 107 + 157)]
+
+
+def test_sentence_autocompleter_follow() -> None:
+    """Lines appended to a followed log are merged into the live engine."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'log.csv')
+        with open(path, 'w') as f:
+            f.write('how to cook,3\n')
+        engine = SentenceAutocompleteEngine({
+            'file': path,
+            'autocompleter': 'compressed',
+            'weight_type': 'sum',
+            'cache_size': 10
+        })
+        assert engine.autocomplete('how') == [('how to cook', 3.0)]
+
+        engine.follow(path, interval=0.01)
+        with open(path, 'a') as f:
+            f.write('How to swim!,2\nhow to cook,1.5\nnot a line\n')
+        deadline = time.monotonic() + 5
+        while len(engine.autocomplete('how')) < 2 and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+        engine.stop_following()
+        assert engine.autocomplete('how') == [('how to cook', 4.5),
+                                              ('how to swim', 2.0)]
+
+
+def test_sentence_autocompleter_follow_malformed() -> None:
+    """Malformed log rows are skipped without stopping the follower, and no
+    merged batch is larger than batch_size.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'log.csv')
+        with open(path, 'w') as f:
+            f.write('how to cook,3\n')
+        engine = SentenceAutocompleteEngine({
+            'file': path,
+            'autocompleter': 'simple',
+            'weight_type': 'sum'
+        })
+        sizes = []
+        merge_weights = engine._merge_weights
+        engine._merge_weights = lambda weights: (sizes.append(len(weights)),
+                                                 merge_weights(weights))
+
+        engine.follow(path, interval=0.01, batch_size=2)
+        with open(path, 'a') as f:
+            f.write('x' * (csv.field_size_limit() + 1) + ',1\n')
+            f.write('bad weight,abc\na,1\nb,1\nc,1\nlast line,2\n')
+        deadline = time.monotonic() + 5
+        while not engine.autocomplete('last') and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+        engine.stop_following()
+        assert engine.autocomplete('last') == [('last line', 2.0)]
+        assert len(engine.autocompleter) == 5
+        assert max(sizes) <= 2
+
 #
+def test_frozen_prefix_tree() -> None:
+    """A frozen tree answers autocomplete like the tree it was frozen from,
+    and cannot be changed.
+    """
+    t = CompressedPrefixTree('average')
+    t.insert('car', 3.0, ['c', 'a', 'r'])
+    t.insert('cat', 2.0, ['c', 'a', 't'])
+    t.insert('dog', 4.0, ['d', 'o', 'g'])
+    t.insert('care', 1.0, ['c', 'a', 'r', 'e'])
+    f = t.freeze()
+
+    assert len(f) == 4
+    for prefix in [[], ['c'], ['c', 'a', 'r'], ['d', 'o'], ['x']]:
+        assert f.autocomplete(prefix) == t.autocomplete(prefix)
+    assert f.autocomplete(['c', 'a'], 2) == [('car', 3.0), ('cat', 2.0)]
+    with pytest.raises(TypeError):
+        f.insert('cow', 1.0, ['c', 'o', 'w'])
+
+
+def test_frozen_prefix_tree_save_load() -> None:
+    """A saved frozen tree loads back, with or without a memory map, into a
+    tree giving the same results.
+    """
+    t = SimplePrefixTree('sum')
+    t.insert('car', 3.0, ['c', 'a', 'r'])
+    t.insert('cat', 2.0, ['c', 'a', 't'])
+    t.insert('dog', 4.0, ['d', 'o', 'g'])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tree.pfx')
+        t.freeze().save(path)
+        for mmap in [True, False]:
+            loaded = FrozenPrefixTree.load(path, mmap)
+            assert len(loaded) == 3
+            assert loaded.weight == 9.0
+            assert loaded.autocomplete([]) == t.autocomplete([])
+            assert loaded.autocomplete(['c'], 1) == [('car', 3.0)]
+
+
+def test_frozen_prefix_tree_load_truncated() -> None:
+    """Loading a truncated saved tree raises ValueError, wherever the file
+    was cut off.
+    """
+    t = SimplePrefixTree('sum')
+    t.insert('car', 3.0, ['c', 'a', 'r'])
+    t.insert('dog', 4.0, ['d', 'o', 'g'])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tree.pfx')
+        t.freeze().save(path)
+        with open(path, 'rb') as file:
+            data = file.read()
+        for size in range(1, len(data)):
+            with open(path, 'wb') as file:
+                file.write(data[:size])
+            for mmap in [True, False]:
+                with pytest.raises(ValueError):
+                    FrozenPrefixTree.load(path, mmap)
+
+
+def test_chunked_reader() -> None:
+    """Blocks end on line boundaries, line endings are translated, and gzip
+    files are read transparently.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'lines.txt.gz')
+        with gzip.open(path, 'wb') as f:
+            f.write('one\r\ntwo\rthr\u00e9e\nfour'.encode('utf8'))
+        for block in list(iter_blocks(path, size=5))[:-1]:
+            assert block.endswith('\n')
+        assert ''.join(iter_blocks(path, size=5)) == \
+            'one\ntwo\nthr\u00e9e\nfour'
+        assert list(iter_lines(path)) == ['one\n', 'two\n',
+                                          'thr\u00e9e\n', 'four']
+
+
+def test_chunked_reader_zstd() -> None:
+    """Every frame of a zstd file with several frames is read."""
+    zstandard = pytest.importorskip('zstandard')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'lines.txt.zst')
+        compressor = zstandard.ZstdCompressor()
+        with open(path, 'wb') as f:
+            f.write(compressor.compress(b'one\r\ntwo\n'))
+            f.write(compressor.compress(b'three\nfour'))
+        assert list(iter_lines(path)) == ['one\n', 'two\n', 'three\n',
+                                          'four']
+
+
+def test_result_cache_invalidation() -> None:
+    """Changes only drop the cached results for prefixes they could affect.
+    """
+    cache = ResultCache(10)
+    for prefix in [[], ['a'], ['a', 'b'], ['a', 'b', 'c'], ['b']]:
+        cache.lookup(prefix, None, lambda p, limit: [])
+    assert cache.stats() == {'hits': 0, 'misses': 5, 'evictions': 0,
+                             'size': 5}
+
+    cache.inserted(['a', 'x'])
+    assert cache.stats()['size'] == 3
+    cache.lookup(['a', 'b'], None, lambda p, limit: [])
+    assert cache.stats()['hits'] == 1
+
+    cache.removed([['a', 'b']])
+    assert cache.stats()['size'] == 1
+
+
 def test_compressed_prefix_tree_structure() -> None:
     """This is a test for the correct structure of a compressed prefix tree.
 
@@ -168,6 +569,56 @@ def test_compressed_prefix_tree_structure() -> None:
     assert right.weight == 4.0
 
 
+def test_compressed_prefix_tree_partial_edge() -> None:
+    """A prefix that ends part way along an edge matches every value below
+    that edge, and from_items splits edges where prefixes part.
+    """
+    items = [('cart', 2.0, ['c', 'a', 'r', 't']),
+             ('care', 1.0, ['c', 'a', 'r', 'e']),
+             ('dog', 4.0, ['d', 'o', 'g'])]
+    inserted = CompressedPrefixTree('sum')
+    for value, weight, prefix in items:
+        inserted.insert(value, weight, prefix)
+    for t in [CompressedPrefixTree.from_items('sum', items), inserted]:
+        assert t.value == []
+        assert len(t.subtrees) == 2
+        car = t.subtrees[1]
+        assert car.value == ['c', 'a', 'r']
+        assert len(car.subtrees) == 2
+
+        assert t.autocomplete(['c']) == [('cart', 2.0), ('care', 1.0)]
+        assert t.autocomplete(['c', 'a']) == [('cart', 2.0), ('care', 1.0)]
+        assert t.autocomplete(['d', 'o']) == [('dog', 4.0)]
+        assert t.autocomplete(['c', 'x']) == []
+
+
+def test_compressed_prefix_tree_remove_compresses() -> None:
+    """Removing values merges a tree left with a single non-leaf subtree
+    into that subtree, including the root.
+    """
+    t = CompressedPrefixTree('sum')
+    t.insert('cart', 2.0, ['c', 'a', 'r', 't'])
+    t.insert('care', 1.0, ['c', 'a', 'r', 'e'])
+    t.insert('cab', 3.0, ['c', 'a', 'b'])
+    t.insert('dog', 4.0, ['d', 'o', 'g'])
+    ca = t.subtrees[0]
+    assert ca.value == ['c', 'a']
+    assert len(ca.subtrees) == 2
+
+    t.remove(['c', 'a', 'b'])
+    ca = t.subtrees[1]
+    assert ca.value == ['c', 'a', 'r']
+    assert len(ca.subtrees) == 2
+    assert [subtree.value for subtree in ca.subtrees] == \
+        [['c', 'a', 'r', 't'], ['c', 'a', 'r', 'e']]
+
+    t.remove(['d'])
+    assert t.value == ['c', 'a', 'r']
+    assert len(t.subtrees) == 2
+    assert t.weight == 3.0
+    assert t.autocomplete(['c', 'a']) == [('cart', 2.0), ('care', 1.0)]
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main(['sample_test.py'])
@@ -0,0 +1,57 @@
+"""CSC148 Assignment 2: Text sanitization
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module description ===
+This file contains the text sanitization shared by the autocomplete engines
+(see the section on "Text sanitization" on the assignment handout).
+
+Sanitizing keeps only the alphanumeric and whitespace characters of a string,
+and converts its letters to lowercase. The work is done by a precompiled
+regular expression and str methods, which process a whole line or a whole
+buffer of lines at once rather than one character at a time.
+"""
+import re
+from typing import List
+
+# Matches every character that is neither alphanumeric nor whitespace. \w
+# also matches the underscore, which is not alphanumeric.
+_UNSANITARY = re.compile(r'[^\w\s]|_')
+
+
+def sanitize(text: str) -> str:
+    """Return <text> with every character that is not alphanumeric or
+    whitespace removed, and every letter in lowercase.
+
+    <text> can be a single line or a buffer of many lines; line breaks are
+    whitespace, and are kept.
+
+    >>> sanitize('What a wonderful world!')
+    'what a wonderful world'
+    >>> sanitize('Numbers are 0K4Y\\nA_B')
+    'numbers are 0k4y\\nab'
+    """
+    return _UNSANITARY.sub('', text).lower()
+
+
+def words(text: str) -> List[str]:
+    """Return the list of words in the sanitized form of <text>.
+
+    A word is a maximal run of alphanumeric characters; any amount of
+    whitespace separates two words.
+
+    >>> words('  a STAR is   born. ')
+    ['a', 'star', 'is', 'born']
+    >>> words('')
+    []
+    """
+    return sanitize(text).split()
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['re']
+    })